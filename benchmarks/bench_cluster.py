@@ -0,0 +1,505 @@
+"""Run the exporter against a synthetic NDK cluster and report how it scales.
+
+Builds realistic objects for all nine kinds, sized from the number of
+ApplicationSnapshots (--sizes, 1k to 200k by default). Other kinds scale with
+it: one Application per ten snapshots, a restore per twenty, a replication
+per two, a JobScheduler and ProtectionPlan per five applications, an
+AppProtectionPlan per application, a ReplicationTarget per namespace and a
+handful of Remotes. Every object carries the managedFields, labels and
+annotations real ones do.
+
+The objects are pre-serialized into LIST pages and served either by an
+in-process stand-in for CustomObjectsApi (the default) or, with --http, by a
+local HTTP server that the real kubernetes client talks to. The stand-in is
+the api of an `ndk_exporter.Cluster`. poll_loop refreshes each kind on its own
+schedule; to measure whole passes without waiting on those schedules, a cycle
+here (poll_cycle) refreshes every kind once in parallel through the same
+refresh() poll_loop calls, each up to its NDK_KIND_TIMEOUT. With --clusters N, N clusters of the same size are
+exported at once, each from its own stand-in (and HTTP server), the way
+NDK_KUBECONFIGS does; a cycle then polls all of them in parallel.
+
+Each size runs in its own process so peak RSS is not shared between sizes:
+
+  cold cycle   first poll cycle, every object new (wall and CPU seconds)
+  warm cycle   a cycle where nothing changed, the steady state (best of --repeat)
+  peak RSS     process high-water mark during the cycles, and the part of it
+               above the RSS held by the served pages
+  allocations  tracemalloc peak and the blocks still live after a traced cold
+               cycle of every kind
+  render       generate_latest() time (best of --repeat) and exposition size,
+               plain and gzip
+  warm start   size of the NDK_STATE_FILE state, time to gather and save it,
+               and time to load it and serve it from fresh clusters
+
+Results are written to --save as JSON. With --compare, each size is checked
+against a saved run and the exit status is 1 if any metric got worse by more
+than --tolerance:
+
+    python benchmarks/bench_cluster.py --sizes 1000,10000,50000 --save benchmarks/results/baseline.json
+    python benchmarks/bench_cluster.py --sizes 1000,10000,50000 --compare benchmarks/results/baseline.json
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import gzip
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ndk_exporter'))
+
+from kubernetes import client  # noqa: E402
+from prometheus_client import CollectorRegistry, generate_latest  # noqa: E402
+
+import ndk_exporter  # noqa: E402
+from series import SeriesCache  # noqa: E402
+import warmstart  # noqa: E402
+
+DATASERVICES = 'dataservices.nutanix.com'
+VERSION = 'v1alpha1'
+TIMESTAMP = '2026-10-01T00:00:00Z'
+
+# Metrics compared by --compare; larger is worse for all of them
+TRACKED = ('cold_cycle_seconds', 'warm_cycle_seconds', 'peak_rss_bytes', 'render_seconds', 'render_bytes')
+
+
+def metadata(kind, i, name, namespace, labels=None, owner=None):
+    meta = {
+        'name': name,
+        'uid': f'00000000-0000-4000-8000-{i:012d}',
+        'resourceVersion': str(1000000 + i),
+        'generation': 1,
+        'creationTimestamp': TIMESTAMP,
+        'labels': dict(labels or {}, **{'app.kubernetes.io/managed-by': 'ndk'}),
+        'annotations': {'dataservices.nutanix.com/last-applied': f'{kind}/{name}'},
+        'managedFields': [{
+            'apiVersion': f'{DATASERVICES}/{VERSION}',
+            'fieldsType': 'FieldsV1',
+            'fieldsV1': {'f:spec': {'.': {}}, 'f:status': {'.': {}, 'f:conditions': {}}},
+            'manager': 'ndk-controller-manager',
+            'operation': 'Update',
+            'time': TIMESTAMP,
+        }],
+    }
+    if namespace is not None:
+        meta['namespace'] = namespace
+    if owner is not None:
+        meta['ownerReferences'] = [{'apiVersion': f'{DATASERVICES}/{VERSION}', 'kind': owner[0], 'name': owner[1],
+                                    'uid': f'00000000-0000-4000-9000-{i:012d}'}]
+    return meta
+
+
+def condition(kind, status):
+    return {'type': kind, 'status': status, 'reason': kind, 'message': f'{kind} is {status}',
+            'lastTransitionTime': TIMESTAMP, 'observedGeneration': 1}
+
+
+class Layout:
+    """How many objects of each kind a cluster with `snapshots` snapshots has."""
+
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+        self.apps = max(1, snapshots // 10)
+        self.namespaces = max(1, min(200, self.apps // 5))
+        self.counts = {
+            'applications': self.apps,
+            'applicationsnapshots': snapshots,
+            'applicationsnapshotrestores': max(1, snapshots // 20),
+            'applicationsnapshotreplications': max(1, snapshots // 2),
+            'replicationtargets': self.namespaces,
+            'remotes': 4,
+            'jobschedulers': max(1, self.apps // 5),
+            'protectionplans': max(1, self.apps // 5),
+            'appprotectionplans': self.apps,
+        }
+
+    def app(self, i):
+        j = i % self.apps
+        return f'app-{j}', f'ns-{j % self.namespaces}'
+
+    def plan(self, j):
+        return f'plan-{j % self.counts["protectionplans"]}'
+
+    def applications(self, i):
+        name, namespace = self.app(i)
+        return {'metadata': metadata('Application', i, name, namespace),
+                'spec': {'applicationSelector': {'resourceLabelSelectors': [{'labelSelector': {
+                    'matchLabels': {'app': name}}}]}},
+                'status': {'conditions': [condition('Active', 'True')]}}
+
+    def applicationsnapshots(self, i):
+        app, namespace = self.app(i)
+        name = f'{app}-snap-{i}'
+        return {'metadata': metadata('ApplicationSnapshot', i, name, namespace,
+                                     {'dataservices.nutanix.com/application': app}, ('Application', app)),
+                'spec': {'source': {'applicationRef': {'name': app}}, 'expiresAfter': '720h'},
+                'status': {'readyToUse': i % 10 != 0,
+                           'creationTime': '2026-10-01T00:00:03Z',
+                           'expirationTime': '2026-10-31T00:00:03Z',
+                           'summary': {'snapshotArtifacts': {'volumesnapshots': [
+                               {'name': f'{name}-pvc-{v}', 'size': '10Gi'} for v in range(3)]}}}}
+
+    def applicationsnapshotrestores(self, i):
+        app, namespace = self.app(i)
+        return {'metadata': metadata('ApplicationSnapshotRestore', i, f'{app}-restore-{i}', namespace),
+                'spec': {'applicationSnapshotName': f'{app}-snap-{i * 20}'},
+                'status': {'completed': i % 7 != 0,
+                           'startTime': '2026-10-02T00:00:00Z',
+                           'finishTime': '2026-10-02T00:04:10Z' if i % 7 else None,
+                           'conditions': [condition('Completed', 'True' if i % 7 else 'False')]}}
+
+    def applicationsnapshotreplications(self, i):
+        app, namespace = self.app(i)
+        return {'metadata': metadata('ApplicationSnapshotReplication', i, f'{app}-repl-{i}', namespace),
+                'spec': {'applicationSnapshotName': f'{app}-snap-{i * 2}',
+                         'replicationTargetName': f'target-{namespace}'},
+                'status': {'conditions': [condition('Available', 'True' if i % 13 else 'False'),
+                                          condition('Progressing', 'False')]}}
+
+    def replicationtargets(self, i):
+        namespace = f'ns-{i}'
+        return {'metadata': metadata('ReplicationTarget', i, f'target-{namespace}', namespace),
+                'spec': {'namespaceName': namespace, 'remoteName': f'remote-{i % 4}'},
+                'status': {'conditions': [condition('Available', 'True')]}}
+
+    def remotes(self, i):
+        return {'metadata': metadata('Remote', i, f'remote-{i}', None),
+                'spec': {'clusterName': f'dr-{i}', 'ndkServiceIp': f'10.0.{i}.10', 'ndkServicePort': 2021},
+                'status': {'conditions': [condition('Available', 'True')]}}
+
+    def jobschedulers(self, i):
+        app, namespace = self.app(i * 5)
+        spec = [{'interval': {'minutes': 60}}, {'daily': {'time': '02:00'}},
+                {'weekly': {'days': ['Monday'], 'time': '03:00'}}, {'cronSchedule': '*/15 * * * *'}][i % 4]
+        return {'metadata': metadata('JobScheduler', i, f'schedule-{i}', namespace),
+                'spec': dict(spec, timeZoneName='Europe/Berlin', startTime=TIMESTAMP)}
+
+    def protectionplans(self, i):
+        app, namespace = self.app(i * 5)
+        return {'metadata': metadata('ProtectionPlan', i, self.plan(i), namespace),
+                'spec': {'scheduleName': f'schedule-{i}', 'retentionPolicy': {'retentionCount': 7}},
+                'status': {'conditions': [condition('Available', 'True'), condition('Degraded', 'False')]}}
+
+    def appprotectionplans(self, i):
+        app, namespace = self.app(i)
+        return {'metadata': metadata('AppProtectionPlan', i, f'{app}-protection', namespace),
+                'spec': {'applicationName': app, 'protectionPlanNames': [self.plan(i // 5)]},
+                'status': {'conditions': [condition('Available', 'True')]}}
+
+    def objects(self, plural):
+        build = getattr(self, plural)
+        for i in range(self.counts[plural]):
+            yield build(i)
+
+
+class Pages:
+    """Pre-serialized LIST pages for every kind, built a page at a time."""
+
+    def __init__(self, layout, page_size):
+        self.page_size = page_size
+        self.pages = {}
+        self.partial_pages = {}
+        self.bytes = 0
+        for kind in ndk_exporter.KINDS:
+            self.pages[kind.plural] = self._serialize(layout.objects(kind.plural), 'List')
+            if kind.fields.metadata_only:
+                partial = ({'apiVersion': 'meta.k8s.io/v1', 'kind': 'PartialObjectMetadata',
+                            'metadata': obj['metadata']} for obj in layout.objects(kind.plural))
+                self.partial_pages[kind.plural] = self._serialize(partial, 'PartialObjectMetadataList')
+
+    def _serialize(self, objects, list_kind):
+        pages = []
+        chunk = []
+        for obj in objects:
+            if self.page_size and len(chunk) == self.page_size:
+                pages.append(self._page(chunk, list_kind, len(pages) + 1))
+                chunk = []
+            chunk.append(obj)
+        pages.append(self._page(chunk, list_kind, None))
+        self.bytes += sum(len(page) for page in pages)
+        return pages
+
+    def _page(self, items, list_kind, next_page):
+        meta = {'resourceVersion': '2000000'}
+        if next_page is not None:
+            meta['continue'] = str(next_page)
+        return json.dumps({'apiVersion': 'v1', 'kind': list_kind, 'metadata': meta, 'items': items}).encode()
+
+    def get(self, plural, token, accept):
+        if accept and 'as=PartialObjectMetadataList' in accept and plural in self.partial_pages:
+            return self.partial_pages[plural][int(token or 0)]
+        return self.pages[plural][int(token or 0)]
+
+
+class RawResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def release_conn(self):
+        pass
+
+
+class FakeCustomObjectsApi:
+    """Serves Pages through the subset of CustomObjectsApi the exporter calls."""
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def list_cluster_custom_object(self, group, version, plural, limit=None, _continue=None,
+                                   _request_timeout=None, _headers=None, _preload_content=True, **kwargs):
+        return RawResponse(self.pages.get(plural, _continue, (_headers or {}).get('Accept')))
+
+
+def serve_http(pages):
+    """Serve Pages on 127.0.0.1 the way the apiserver does, return the server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            query = dict(urllib.parse.parse_qsl(url.query))
+            body = pages.get(url.path.rstrip('/').rsplit('/', 1)[-1], query.get('continue'),
+                             self.headers.get('Accept'))
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def http_api(server):
+    configuration = client.Configuration(host=f'http://127.0.0.1:{server.server_port}')
+    configuration.connection_pool_maxsize = 2 * len(ndk_exporter.KINDS)
+    return client.CustomObjectsApi(client.ApiClient(configuration))
+
+
+def rss_bytes(field):
+    """Current (VmRSS) or peak (VmHWM) resident set size of this process."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux only)
+    try:
+        with open('/proc/self/clear_refs', 'w') as refs:
+            refs.write('5')
+    except OSError:
+        pass
+
+
+def reset_caches(clusters):
+    for cluster in clusters:
+        cluster.caches = {kind.plural: SeriesCache(kind.metrics, kind.series) for kind in ndk_exporter.KINDS}
+
+
+def poll_cycle(cluster, pool, inflight):
+    """Refresh every kind of a cluster in parallel and wait for each one up to its deadline.
+
+    `inflight` maps each kind to its last refresh and is carried from one
+    cycle to the next. Returns how long the cycle took.
+    """
+    started = time.monotonic()
+    for kind in ndk_exporter.KINDS:
+        plural = kind.plural
+        # Never start a second refresh of a kind that is still running
+        if plural in inflight and not inflight[plural].done():
+            continue
+        inflight[plural] = pool.submit(ndk_exporter.refresh, cluster, kind)
+
+    for plural, future in inflight.items():
+        deadline = started + ndk_exporter.kind_timeout(plural)
+        try:
+            future.result(timeout=max(0, deadline - time.monotonic()))
+        except concurrent.futures.TimeoutError as e:
+            # The refresh keeps running and publishes if it finishes later
+            ndk_exporter.timed_out(cluster, plural, e)
+        except Exception:
+            # Already logged and counted by refresh
+            pass
+    return time.monotonic() - started
+
+
+def timed(fn, *args):
+    wall, cpu = time.perf_counter(), time.process_time()
+    fn(*args)
+    return time.perf_counter() - wall, time.process_time() - cpu
+
+
+def run_size(snapshots, page_size, repeat, use_http, count):
+    layout = Layout(snapshots)
+    pages = Pages(layout, page_size)
+    servers = [serve_http(pages) for _ in range(count)] if use_http else []
+    apis = [http_api(server) for server in servers] if use_http else [FakeCustomObjectsApi(pages) for _ in range(count)]
+    if count == 1:
+        clusters = [ndk_exporter.Cluster('', apis[0])]
+    else:
+        clusters = [ndk_exporter.Cluster(f'cluster-{n}', api, CollectorRegistry()) for n, api in enumerate(apis)]
+    ndk_exporter.clusters.extend(clusters)
+    ndk_exporter.PAGE_SIZE = page_size
+    pools = [concurrent.futures.ThreadPoolExecutor(max_workers=len(ndk_exporter.KINDS)) for _ in clusters]
+    inflights = [{} for _ in clusters]
+    loops = concurrent.futures.ThreadPoolExecutor(max_workers=count)
+
+    def cycle():
+        for future in [loops.submit(poll_cycle, cluster, pool, inflight)
+                       for cluster, pool, inflight in zip(clusters, pools, inflights)]:
+            future.result()
+
+    result = {'objects': count * sum(layout.counts.values()), 'counts': layout.counts, 'pages_bytes': pages.bytes}
+    base_rss = rss_bytes('VmRSS')
+    reset_peak_rss()
+
+    # The exporter logs to stdout; keep that out of the report
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result['cold_cycle_seconds'], result['cold_cycle_cpu_seconds'] = timed(cycle)
+        warm = [timed(cycle) for _ in range(repeat)]
+        result['warm_cycle_seconds'] = min(w for w, _ in warm)
+        result['warm_cycle_cpu_seconds'] = min(c for _, c in warm)
+        result['peak_rss_bytes'] = rss_bytes('VmHWM')
+        result['cycle_rss_bytes'] = result['peak_rss_bytes'] - base_rss
+
+        renders = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = generate_latest(ndk_exporter.federation)
+            renders.append(time.perf_counter() - start)
+        result['render_seconds'] = min(renders)
+        result['render_bytes'] = len(body)
+        result['render_gzip_bytes'] = len(gzip.compress(body))
+        result['series'] = sum(1 for line in body.splitlines() if line.startswith(b'ndk_') and
+                               not line.startswith(b'ndk_exporter_'))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'state')
+            start = time.perf_counter()
+            result['state_bytes'] = warmstart.dump(path, dict(ndk_exporter.gather_state(), saved_at=time.time()))
+            result['state_save_seconds'] = time.perf_counter() - start
+            start = time.perf_counter()
+            state = warmstart.load(path, 3600)
+            for cluster in clusters:
+                ndk_exporter.restore_cluster(ndk_exporter.Cluster(cluster.name, cluster.api, CollectorRegistry()),
+                                             state['clusters'][cluster.name])
+            result['state_restore_seconds'] = time.perf_counter() - start
+            del state
+
+        # A cold cycle again, kind by kind, with allocations traced
+        reset_caches(clusters)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for cluster in clusters:
+            for kind in ndk_exporter.KINDS:
+                ndk_exporter.refresh(cluster, kind)
+        current, peak = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+        tracemalloc.stop()
+        result['alloc_peak_bytes'] = peak - before
+        result['alloc_retained_bytes'] = current - before
+        result['alloc_live_blocks'] = blocks
+
+    loops.shutdown(wait=True)
+    for pool in pools:
+        pool.shutdown(wait=True)
+    for server in servers:
+        server.shutdown()
+    return result
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for size, result in results.items():
+        old = baseline.get('results', {}).get(size)
+        if old is None:
+            continue
+        for metric in TRACKED:
+            if metric in old and old[metric] and result[metric] > old[metric] * (1 + tolerance):
+                regressions.append((size, metric, old[metric], result[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,50000,200000',
+                        help='comma separated ApplicationSnapshot counts')
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--http', action='store_true', help='serve through a local HTTP server and the real client')
+    parser.add_argument('--clusters', type=int, default=1, help='export this many clusters of each size at once')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='a saved results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='how much worse than --compare a metric may get (0.25 = 25%%)')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        json.dump(run_size(args.single, args.page_size, args.repeat, args.http, args.clusters), sys.stdout)
+        return
+
+    results = {}
+    print(f"{'snapshots':>9} {'objects':>8} {'cold s':>7} {'warm s':>7} {'peak RSS MB':>11} {'cycle RSS MB':>12} "
+          f"{'alloc peak MB':>13} {'render s':>8} {'render KB':>9} {'gzip KB':>8} {'series':>8} "
+          f"{'state MB':>8} {'restore s':>9}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        command = [sys.executable, os.path.abspath(__file__), '--single', str(size),
+                   '--page-size', str(args.page_size), '--repeat', str(args.repeat), '--clusters', str(args.clusters)]
+        if args.http:
+            command.append('--http')
+        r = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+        results[str(size)] = r
+        print(f"{size:>9} {r['objects']:>8} {r['cold_cycle_seconds']:>7.2f} {r['warm_cycle_seconds']:>7.2f} "
+              f"{r['peak_rss_bytes'] / 1e6:>11.1f} {r['cycle_rss_bytes'] / 1e6:>12.1f} "
+              f"{r['alloc_peak_bytes'] / 1e6:>13.1f} {r['render_seconds']:>8.3f} {r['render_bytes'] / 1e3:>9.0f} "
+              f"{r['render_gzip_bytes'] / 1e3:>8.0f} {r['series']:>8} "
+              f"{r['state_bytes'] / 1e6:>8.1f} {r['state_restore_seconds']:>9.2f}")
+
+    run = {
+        'python': sys.version.split()[0],
+        'http': args.http,
+        'clusters': args.clusters,
+        'page_size': args.page_size,
+        'results': results,
+    }
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as out:
+            json.dump(run, out, indent=2, sort_keys=True)
+            out.write('\n')
+
+    if args.compare:
+        with open(args.compare) as saved:
+            regressions = compare(results, json.load(saved), args.tolerance)
+        for size, metric, old, new in regressions:
+            print(f"REGRESSION {size} snapshots: {metric} {old:.4g} -> {new:.4g} ({new / old - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Measure how many bytes the exporter keeps per tracked object.
+
+Builds the synthetic cluster of bench_cluster.py with --snapshots
+ApplicationSnapshots (and one ApplicationSnapshotRestore per twenty), serves
+it as pre-serialized LIST pages and reports, per object of each kind, what is
+still allocated (tracemalloc) after:
+
+  decoded   keeping every decoded object, as a cache of full objects would
+  records   keeping only the records projected from them (see projection.Fields)
+  tracked   a refresh of the kind on a fresh Cluster: its records, series,
+            families and rollups, as the exporter holds them between refreshes
+
+and the CPU time of a refresh where nothing changed, best of --repeat.
+
+    python benchmarks/bench_memory.py --snapshots 100000
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ndk_exporter'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from prometheus_client import CollectorRegistry  # noqa: E402
+
+import ndk_exporter  # noqa: E402
+from bench_cluster import FakeCustomObjectsApi, Layout, Pages  # noqa: E402
+
+PLURALS = ('applicationsnapshots', 'applicationsnapshotrestores')
+
+
+def retained(build):
+    """Bytes still allocated once `build()` has returned, with its result kept alive."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def measure(kind, pages, repeat):
+    page_list = pages.pages[kind.plural]
+
+    def decoded():
+        return [obj for page in page_list for obj in json.loads(page)['items']]
+
+    def records():
+        return [kind.fields.project(obj) for page in page_list for obj in json.loads(page)['items']]
+
+    cluster = ndk_exporter.Cluster('', FakeCustomObjectsApi(pages), CollectorRegistry())
+    objects = sum(len(json.loads(page)['items']) for page in page_list)
+    result = {
+        'objects': objects,
+        'decoded_bytes': retained(decoded),
+        'records_bytes': retained(records),
+        'tracked_bytes': retained(lambda: ndk_exporter.refresh(cluster, kind)),
+    }
+    warm = []
+    for _ in range(repeat):
+        start = time.process_time()
+        ndk_exporter.refresh(cluster, kind)
+        warm.append(time.process_time() - start)
+    result['warm_refresh_cpu_seconds'] = min(warm)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--snapshots', type=int, default=100000)
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    ndk_exporter.PAGE_SIZE = args.page_size
+    pages = Pages(Layout(args.snapshots), args.page_size)
+    kinds = [kind for kind in ndk_exporter.KINDS if kind.plural in PLURALS]
+
+    print(f"{'kind':<28} {'objects':>8} {'decoded B/obj':>13} {'records B/obj':>13} {'tracked B/obj':>13} "
+          f"{'warm refresh cpu s':>18}")
+    for kind in kinds:
+        # The exporter logs to stdout; keep that out of the report
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            r = measure(kind, pages, args.repeat)
+        n = r['objects']
+        print(f"{kind.plural:<28} {n:>8} {r['decoded_bytes'] / n:>13.0f} {r['records_bytes'] / n:>13.0f} "
+              f"{r['tracked_bytes'] / n:>13.0f} {r['warm_refresh_cpu_seconds']:>18.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import collections
+import fnmatch
+
+from snapshot import Metric
+
+
+def parse_patterns(value):
+    """Parse a comma separated list of namespace names or glob patterns."""
+    return tuple(pattern.strip() for pattern in value.split(',') if pattern.strip())
+
+
+class NamespaceFilter:
+    """Decides which namespaced objects are exported at all.
+
+    A namespace must match one of `allow` (when given) and none of `deny`;
+    both are fnmatch patterns such as "team-*". With `owns` (a Shard's) it
+    must also be one of this replica's namespaces. Cluster-scoped objects
+    always pass. Called with a record, so it can be handed to SeriesCache as
+    `keep`, or asked about a namespace name with allows().
+    """
+
+    def __init__(self, allow=(), deny=(), owns=None):
+        self.allow = tuple(allow)
+        self.deny = tuple(deny)
+        self.owns = owns
+        self._decided = {}
+
+    def __bool__(self):
+        return bool(self.allow or self.deny or self.owns)
+
+    def __call__(self, rec):
+        return self.allows(rec.namespace)
+
+    def allows(self, namespace):
+        if not namespace:
+            return True
+        allowed = self._decided.get(namespace)
+        if allowed is None:
+            allowed = self._decided[namespace] = (
+                (not self.allow or any(fnmatch.fnmatchcase(namespace, p) for p in self.allow)) and
+                not any(fnmatch.fnmatchcase(namespace, p) for p in self.deny) and
+                (self.owns is None or self.owns(namespace))
+            )
+        return allowed
+
+
+class CountBy:
+    """Exports how many samples of `source` share each combination of
+    `labelnames`, in place of the samples themselves.
+
+    Used by aggregate-only mode to turn per-object info series into
+    per-namespace counts. Like a Metric it has a `source` and builds a family
+    from that metric's samples, so SeriesCache can export either.
+    """
+
+    def __init__(self, source, name, documentation, labelnames):
+        self.source = source
+        self.metric = Metric(name, documentation, labelnames)
+
+    @property
+    def name(self):
+        return self.metric.name
+
+    def family(self, samples=(), dropped=None):
+        labelnames = self.metric.labelnames
+        counts = collections.Counter(tuple(sample.labels[name] for name in labelnames) for sample in samples)
+        return self.metric.family(
+            (self.metric.sample(count, **dict(zip(labelnames, key)))[1] for key, count in counts.items()), dropped
+        )
+
+
+def apply_caps(metrics, default, overrides):
+    """Limit each metric to `overrides[name]` series, or `default` (0 for no limit)."""
+    for metric in metrics:
+        metric = getattr(metric, 'metric', metric)
+        metric.max_series = int(overrides.get(metric.name, default))
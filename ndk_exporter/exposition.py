@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from prometheus_client import generate_latest
+from prometheus_client.openmetrics import exposition as openmetrics
+
+TEXT = 'text'
+OPENMETRICS = 'openmetrics'
+
+FORMATS = {
+    TEXT: (generate_latest, 'text/plain; version=0.0.4; charset=utf-8'),
+    OPENMETRICS: (openmetrics.generate_latest, openmetrics.CONTENT_TYPE_LATEST),
+}
+
+# Fastest compression: the body is compressed once per render, but a large
+# one is tens of megabytes. On a 36 MB body level 1 takes about half the time
+# of level 6 for a result about a third larger.
+GZIP_LEVEL = 1
+
+
+def negotiate(accept):
+    """Pick the exposition format for an Accept header, as prometheus_client does."""
+    for accepted in (accept or '').split(','):
+        if accepted.split(';')[0].strip() == 'application/openmetrics-text':
+            return OPENMETRICS
+    return TEXT
+
+
+def accepts_gzip(accept_encoding):
+    return 'gzip' in (accept_encoding or '')
+
+
+class Rendered:
+    """One exposition format rendered at one point in time."""
+
+    def __init__(self, body, content_type):
+        self.content_type = content_type
+        self.plain = body
+        self.gzip = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        digest = hashlib.blake2b(body, digest_size=12).hexdigest()
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'
+
+
+class ExpositionCache:
+    """Serves /metrics from bodies rendered once per refresh instead of per scrape.
+
+    render() serializes the registry into every format that has been asked
+    for so far (text until an OpenMetrics scraper shows up) and keeps the
+    plain and gzip bytes of each, so a scrape only copies a buffer to its
+    socket no matter how many Prometheus replicas ask. Each body gets an ETag
+    from its content; a scraper that sends it back in If-None-Match gets a 304
+    until the next render changes the data.
+
+    A format requested for the first time is rendered on that scrape and from
+    then on with every render().
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._rendered = {}
+        self._formats = {TEXT}
+        self._lock = threading.Lock()
+
+    def render(self):
+        with self._lock:
+            formats = tuple(self._formats)
+        rendered = {fmt: self._render(fmt) for fmt in formats}
+        with self._lock:
+            self._rendered = rendered
+
+    def _render(self, fmt):
+        encoder, content_type = FORMATS[fmt]
+        return Rendered(encoder(self.registry), content_type)
+
+    def get(self, fmt):
+        rendered = self._rendered.get(fmt)
+        if rendered is not None:
+            return rendered
+        with self._lock:
+            # Another scrape may have rendered it while we waited
+            rendered = self._rendered.get(fmt)
+            if rendered is None:
+                self._formats.add(fmt)
+                rendered = self._render(fmt)
+                self._rendered = dict(self._rendered, **{fmt: rendered})
+            return rendered
+
+
+def start_exposition_server(port, cache, on_scrape=None, addr='0.0.0.0'):
+    """Serve `cache` over HTTP on every path, like prometheus_client's start_http_server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self._respond(send_body=True)
+
+        def do_HEAD(self):
+            self._respond(send_body=False)
+
+        def _respond(self, send_body):
+            rendered = cache.get(negotiate(self.headers.get('Accept')))
+            compressed = accepts_gzip(self.headers.get('Accept-Encoding'))
+            etag = rendered.gzip_etag if compressed else rendered.etag
+
+            if etag in (self.headers.get('If-None-Match') or ''):
+                code, body = 304, b''
+            else:
+                code, body = 200, rendered.gzip if compressed else rendered.plain
+
+            self.send_response(code)
+            self.send_header('Content-Type', rendered.content_type)
+            self.send_header('ETag', etag)
+            self.send_header('Vary', 'Accept, Accept-Encoding')
+            if compressed and code == 200:
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if send_body and body:
+                self.wfile.write(body)
+            if on_scrape is not None:
+                on_scrape(code)
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='exposition', daemon=True).start()
+    return server
@@ -0,0 +1,69 @@
+import copy
+import os
+
+from kubernetes import config
+
+
+def context_cluster(path):
+    """The name of the cluster the current context of a kubeconfig points at."""
+    _, context = config.list_kube_config_contexts(config_file=path)
+    return context['context']['cluster']
+
+
+def parse_kubeconfigs(value):
+    """[(cluster name, kubeconfig path)] from NDK_KUBECONFIGS.
+
+    Entries are comma separated, each a kubeconfig path or name=path. A
+    directory stands for every file in it (as mounted from a Secret). A
+    kubeconfig without a name is named after the cluster of its current
+    context.
+    """
+    clusters = []
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, path = entry.rpartition('=')
+        if os.path.isdir(path):
+            paths = sorted(os.path.join(path, f) for f in os.listdir(path)
+                           if not f.startswith('.') and os.path.isfile(os.path.join(path, f)))
+            clusters.extend((context_cluster(p), p) for p in paths)
+        else:
+            clusters.append((name or context_cluster(path), path))
+    names = [name for name, _ in clusters]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"NDK_KUBECONFIGS names clusters more than once: {', '.join(duplicates)}")
+    return clusters
+
+
+class Federation:
+    """Serves the registries of several clusters as one, each sample labelled with its cluster.
+
+    Families of the same name from different clusters are merged so every
+    metric appears once in the exposition. `registry` holds the metrics of
+    the exporter process itself and is passed through unchanged, as is a
+    cluster registered on it directly (when only the local cluster is
+    exported).
+    """
+
+    def __init__(self, registry, clusters):
+        self.registry = registry
+        self.clusters = clusters
+
+    def collect(self):
+        yield from self.registry.collect()
+        merged = {}
+        for cluster in self.clusters:
+            if cluster.registry is self.registry:
+                continue
+            for family in cluster.registry.collect():
+                samples = [sample._replace(labels=dict(sample.labels, cluster=cluster.name))
+                           for sample in family.samples]
+                target = merged.get(family.name)
+                if target is None:
+                    target = merged[family.name] = copy.copy(family)
+                    target.samples = samples
+                else:
+                    target.samples.extend(samples)
+        yield from merged.values()
@@ -0,0 +1,217 @@
+import json
+import threading
+import time
+
+from kubernetes.client.rest import ApiException
+
+from listing import PARTIAL_WATCH_ACCEPT, ListPager
+
+# Server-side watch timeout; the apiserver closes the stream after this and we
+# reconnect from the last seen resourceVersion.
+WATCH_TIMEOUT_SECONDS = 300
+# Client-side timeout of each relist page request unless the informer is given
+# one, so a LIST stalled on a half-open connection fails and is retried
+LIST_TIMEOUT_SECONDS = 60
+
+
+def object_key(obj):
+    metadata = obj.get('metadata', {})
+    return (metadata.get('namespace', ''), metadata.get('name'))
+
+
+def iter_lines(resp):
+    """Split a streaming watch response into newline delimited JSON events."""
+    buffer = b''
+    for chunk in resp.stream(amt=None, decode_content=True):
+        buffer += chunk
+        lines = buffer.split(b'\n')
+        buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+class Informer:
+    """Keeps an in-memory copy of one custom resource kind current.
+
+    The informer does a single LIST to fill its store and then follows a WATCH
+    stream from the returned resourceVersion. Bookmarks advance the
+    resourceVersion without touching the store, and a 410 Gone (either as an
+    HTTP status or as an ERROR event) throws the resourceVersion away so the
+    next pass relists. With `project` set, the store holds what it returns for
+    each object rather than the whole object, and with `metadata_only` set
+    both the list and the watch ask for PartialObjectMetadata. With `keep`
+    set only objects in the namespaces it returns True for are stored; the
+    rest are dropped before they are projected. Requests, objects and errors
+    are counted in `metrics`, a ClusterMetrics. Each page of a relist may take
+    up to `list_timeout` seconds.
+
+    snapshot() and restore() save and reload the store and resourceVersion,
+    so a restarted exporter can resume the watch instead of relisting.
+    """
+
+    def __init__(self, api, group, version, plural, metrics, page_size=500, project=None, decode=json.loads,
+                 metadata_only=False, on_change=None, keep=None, list_timeout=LIST_TIMEOUT_SECONDS):
+        self.api = api
+        self.group = group
+        self.version = version
+        self.plural = plural
+        self.metrics = metrics
+        self.page_size = page_size
+        self.project = project
+        self.decode = decode
+        self.metadata_only = metadata_only
+        self.on_change = on_change
+        self.keep = keep
+        self.list_timeout = list_timeout
+        self.resource_version = None
+        self.synced = False
+        # False while the store may be behind the apiserver: when it is only
+        # what restore() loaded, or since a list or watch failed. Set again by
+        # the next relist or a watch the apiserver accepts.
+        self.current = False
+        self._store = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name=f"informer-{self.plural}", daemon=True)
+        self._thread.start()
+
+    def run(self):
+        backoff = 1
+        while True:
+            try:
+                if self.resource_version is None:
+                    self.relist()
+                self.watch()
+                backoff = 1
+            except ApiException as e:
+                if e.status == 410:
+                    print(f"Watch on {self.plural} expired, relisting")
+                    self.resource_version = None
+                    self.current = False
+                    continue
+                self._failed(e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+            except Exception as e:
+                self._failed(e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def _failed(self, e):
+        print(f"Error watching {self.plural}: {e}")
+        self.metrics.errors.labels(kind=self.plural, exception=type(e).__name__).inc()
+        # Events may be missed until the watch is back, so the store is stale
+        if self.current:
+            self.current = False
+            self._notify()
+
+    def relist(self):
+        # An expired continue token surfaces as a 410 and lands back here via run()
+        pager = ListPager(self.api, self.group, self.version, self.plural, self.page_size, self.list_timeout,
+                          decode=self.decode, metadata_only=self.metadata_only)
+        keep = self.keep
+        store = {}
+        for item in pager:
+            key = object_key(item)
+            if keep is None or keep(key[0]):
+                store[key] = self._project(item)
+        with self._lock:
+            self._store = store
+            self._dirty = True
+        self.resource_version = pager.resource_version
+        self.synced = True
+        self.current = True
+        self.metrics.refresh_duration.labels(kind=self.plural, phase='list').observe(pager.fetch_seconds)
+        self.metrics.objects_processed.labels(kind=self.plural).inc(pager.items)
+        self.metrics.response_bytes.labels(kind=self.plural).inc(pager.bytes)
+        self.metrics.last_success.labels(kind=self.plural).set_to_current_time()
+        self._notify()
+
+    def watch(self):
+        resp = self.api.list_cluster_custom_object(
+            self.group, self.version, self.plural,
+            watch=True,
+            resource_version=self.resource_version,
+            allow_watch_bookmarks=True,
+            timeout_seconds=WATCH_TIMEOUT_SECONDS,
+            _preload_content=False,
+            _request_timeout=(10, WATCH_TIMEOUT_SECONDS + 30),
+            _headers={'Accept': PARTIAL_WATCH_ACCEPT} if self.metadata_only else None
+        )
+        # The apiserver still has our resourceVersion, so the store is current
+        # once the events since then have been applied
+        if not self.current:
+            self.current = True
+            self._notify()
+        try:
+            for line in iter_lines(resp):
+                self.metrics.response_bytes.labels(kind=self.plural).inc(len(line))
+                event = self.decode(line)
+                event_type = event.get('type')
+                obj = event.get('object', {})
+
+                if event_type == 'ERROR':
+                    if obj.get('code') == 410:
+                        print(f"Watch on {self.plural} expired, relisting")
+                        self.resource_version = None
+                        self.current = False
+                        return
+                    raise ApiException(status=obj.get('code'), reason=obj.get('message'))
+
+                resource_version = obj.get('metadata', {}).get('resourceVersion')
+                if event_type != 'BOOKMARK':
+                    self.metrics.objects_processed.labels(kind=self.plural).inc()
+                    key = object_key(obj)
+                    # Objects in another shard's (or a filtered out) namespace are never stored
+                    if self.keep is None or self.keep(key[0]):
+                        with self._lock:
+                            if event_type == 'DELETED':
+                                self._store.pop(key, None)
+                            else:
+                                self._store[key] = self._project(obj)
+                            self._dirty = True
+                        self._notify()
+                if resource_version:
+                    self.resource_version = resource_version
+            # The server closed the stream after its timeout with the store current
+            self.metrics.last_success.labels(kind=self.plural).set_to_current_time()
+        finally:
+            resp.close()
+            resp.release_conn()
+
+    def _project(self, obj):
+        return self.project(obj) if self.project is not None else obj
+
+    def _notify(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def items(self):
+        with self._lock:
+            return list(self._store.values())
+
+    def snapshot(self):
+        """(resourceVersion, [(key, record)]) with the store at least as new as the version."""
+        resource_version = self.resource_version
+        with self._lock:
+            return resource_version, list(self._store.items())
+
+    def restore(self, resource_version, items):
+        """Start from a saved store; before start(). The watch resumes from
+        `resource_version`, or relists if the apiserver no longer has it."""
+        self._store = dict(items)
+        self._dirty = True
+        self.resource_version = resource_version
+        self.synced = True
+
+    def take_dirty(self):
+        """Return True once after every change to the store."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, False
+            return dirty
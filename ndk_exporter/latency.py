@@ -0,0 +1,128 @@
+import abc
+import time
+
+from prometheus_client import REGISTRY, Histogram
+
+
+def restore_duration(registry):
+    return Histogram(
+        'ndk_application_restore_duration_seconds',
+        'Time from startTime to finishTime of completed ApplicationSnapshotRestores',
+        ['namespace'],
+        buckets=(30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 14400, 28800, 86400),
+        registry=registry
+    )
+
+
+def snapshot_ready_latency(registry):
+    return Histogram(
+        'ndk_application_snapshot_ready_latency_seconds',
+        'Time from creation until an ApplicationSnapshot was first seen readyToUse '
+        '(accurate to the refresh interval; not observed when refreshes were missed)',
+        ['namespace'],
+        buckets=(5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200),
+        registry=registry
+    )
+
+
+class LatencyTracker(abc.ABC):
+    """Observes once per object how long it took to get done.
+
+    Objects are told apart by UID. An object is observed the first time it is
+    seen done, provided the exporter either saw it before it was done or it
+    got done after the exporter started; objects that were already done
+    before then were counted by an earlier run (or never will be), so
+    restarts and relists do not count anything twice. Only the UIDs of
+    objects that still exist are kept, with the time each was last seen not
+    done so latency() can tell how well it knows when it got done.
+    """
+
+    def __init__(self, histogram, started=None):
+        self.histogram = histogram
+        self.started = time.time() if started is None else started
+        # UID -> True once done (and observed if it was going to be), else
+        # the last time it was seen not done
+        self._seen = {}
+
+    def update(self, records, now=None):
+        now = time.time() if now is None else now
+        previous = self._seen
+        seen = {}
+        for rec in records:
+            uid = rec.uid
+            if uid is None:
+                continue
+            last = previous.get(uid)
+            if last is True:
+                seen[uid] = True
+                continue
+            latency, done_at = self.latency(rec, now, last)
+            if done_at is None:
+                seen[uid] = now
+                continue
+            if latency is not None and (last is not None or done_at >= self.started):
+                self.histogram.labels(namespace=rec.namespace).observe(max(0, latency))
+            seen[uid] = True
+        self._seen = seen
+
+    def checked(self, now=None):
+        """Record that the objects not done at the last update() still were at
+        `now`: their kind was refreshed, or its watch stayed current, without
+        any of them changing."""
+        now = time.time() if now is None else now
+        seen = self._seen
+        for uid, last in seen.items():
+            if last is not True:
+                seen[uid] = now
+
+    @abc.abstractmethod
+    def latency(self, rec, now, last):
+        """(latency, when it got done) for a done object, or (None, None) while
+        it is not. `last` is when it was last seen not done, or None. A latency
+        of None for a done object means it is done but not observed."""
+
+    def state(self):
+        return dict(self._seen)
+
+    def restore(self, seen):
+        """Pick up from state(), before the first update(). Objects seen not done
+        before the restart are observed when they are next seen done, if
+        latency() still can."""
+        self._seen = dict(seen)
+
+
+class RestoreLatency(LatencyTracker):
+
+    def __init__(self, registry=REGISTRY, started=None):
+        super().__init__(restore_duration(registry), started)
+
+    def latency(self, rec, now, last):
+        if rec.completed is not True:
+            return None, None
+        start, finish = rec.start_time, rec.finish_time
+        if start is None or finish is None:
+            return None, None
+        return finish - start, finish
+
+
+class SnapshotReadyLatency(LatencyTracker):
+    """Snapshots only say when they were created, so one is taken to have got
+    ready when it is first seen ready. That is only accurate if it was seen
+    not ready (or created) shortly before: a snapshot that was last seen not
+    ready more than two refresh `interval`s earlier got ready while refreshes
+    were missed (backoff, an outage or a restart) and is not observed."""
+
+    def __init__(self, registry=REGISTRY, started=None, interval=30):
+        super().__init__(snapshot_ready_latency(registry), started)
+        self.interval = interval
+
+    def latency(self, rec, now, last):
+        if rec.ready_to_use is not True:
+            return None, None
+        created = rec.created
+        if created is None:
+            return None, None
+        # Creation after the exporter started is what makes an unseen snapshot new
+        if now - max(created, last or created) > 2 * self.interval:
+            return None, created
+        return now - created, created
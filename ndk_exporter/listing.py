@@ -0,0 +1,119 @@
+import json
+import time
+
+from kubernetes.client.rest import ApiException
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Ask for metadata only (falling back to full objects on apiservers that
+# cannot serve the partial representation)
+PARTIAL_LIST_ACCEPT = 'application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1,application/json'
+PARTIAL_WATCH_ACCEPT = 'application/json;as=PartialObjectMetadata;g=meta.k8s.io;v=v1,application/json'
+
+
+def json_decoder(fast):
+    """Return the function used to decode raw list and watch bodies."""
+    if fast:
+        if orjson is not None:
+            return orjson.loads
+        print("NDK_FAST_JSON is set but orjson is not installed, using the json module")
+    return json.loads
+
+
+def list_custom_objects(api, group, version, plural, namespace=None, **kwargs):
+    """List custom objects cluster-wide, or in one namespace if given."""
+    if namespace is None:
+        return api.list_cluster_custom_object(group, version, plural, **kwargs)
+    return api.list_namespaced_custom_object(group, version, namespace, plural, **kwargs)
+
+
+class ContinueExpired(ApiException):
+    """The continue token of a chunked LIST expired before the last page was read."""
+
+
+class ListPager:
+    """Iterates the items of a cluster-wide LIST one page at a time.
+
+    With `namespace` set only that namespace is listed.
+
+    Each page is requested with `limit` and the `continue` token of the page
+    before it, and is dropped before the next one is fetched, so memory use
+    follows the page size instead of the number of objects in the cluster.
+    After a full pass `resource_version` holds the version the list was served
+    at (the same for every page of a consistent chunked list).
+
+    Every body is read raw (`_preload_content=False`) and handed straight to
+    `decode` (json.loads unless given), skipping the client's deserializer.
+    While iterating, `bytes` and `items` count the response bytes and objects
+    read and `fetch_seconds` the time spent requesting and decoding pages.
+    With `metadata_only` set the list is requested as a
+    PartialObjectMetadataList, whose items carry only apiVersion, kind and
+    metadata.
+
+    If the apiserver has compacted away the snapshot a continue token points at
+    it answers 410 Gone. Carrying on with the token from that error would mix
+    two snapshots, so ContinueExpired is raised instead and the caller starts a
+    fresh list.
+    """
+
+    def __init__(self, api, group, version, plural, page_size=500, request_timeout=None, decode=json.loads,
+                 metadata_only=False, namespace=None):
+        self.api = api
+        self.group = group
+        self.version = version
+        self.plural = plural
+        self.namespace = namespace
+        self.page_size = page_size
+        self.request_timeout = request_timeout
+        self.decode = decode or json.loads
+        self.headers = {'Accept': PARTIAL_LIST_ACCEPT} if metadata_only else None
+        self.resource_version = None
+        self.bytes = 0
+        self.items = 0
+        self.fetch_seconds = 0.0
+
+    def __iter__(self):
+        token = None
+        while True:
+            started = time.monotonic()
+            try:
+                resp = self._fetch(token)
+            except ApiException as e:
+                if e.status == 410 and token:
+                    raise ContinueExpired(status=e.status, reason=e.reason)
+                raise
+            finally:
+                self.fetch_seconds += time.monotonic() - started
+
+            metadata = resp.get('metadata', {})
+            self.resource_version = metadata.get('resourceVersion')
+            token = metadata.get('continue')
+            items = resp.get('items', [])
+            self.items += len(items)
+            resp = None
+
+            yield from items
+            items = None
+
+            if not token:
+                return
+
+    def _fetch(self, token):
+        raw = list_custom_objects(
+            self.api, self.group, self.version, self.plural, self.namespace,
+            limit=self.page_size or None,
+            _continue=token,
+            _request_timeout=self.request_timeout,
+            _headers=self.headers,
+            _preload_content=False
+        )
+        try:
+            data = raw.data
+            self.bytes += len(data)
+            return self.decode(data)
+        finally:
+            raw.release_conn()
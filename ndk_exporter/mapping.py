@@ -0,0 +1,199 @@
+import sys
+from collections import namedtuple
+
+from cardinality import CountBy
+from projection import Fields, conditions, intern, timestamp
+from snapshot import Metric
+
+# Functions a field spec may name to convert the value at its path
+CONVERTERS = {
+    'conditions': conditions,
+    'intern': intern,
+    'timestamp': timestamp,
+}
+
+
+class Kind(namedtuple('Kind', ['plural', 'group', 'version', 'fields', 'metrics', 'series', 'interval', 'rollups',
+                               'namespaced', 'aggregates'], defaults=[(), True, None])):
+    """An NDK custom resource kind, compiled from its entry in a kind table
+    (see compile_kind): the metrics it feeds, the function that turns one of
+    its records into samples for them, how often poll mode refreshes it while
+    it is quiet, the rollups whose update() is given every record of the kind
+    after each change (named by their Cluster attribute), whether it is
+    namespaced and what aggregate-only mode exports instead of its metrics
+    (None to keep exporting them)."""
+
+
+def _milliseconds(value, arg):
+    if not isinstance(value, (int, float)):
+        value = timestamp(value)
+    return int(value * 1000) if value else 0
+
+
+def _default(value, arg):
+    return arg if value is None or value == '' else value
+
+
+def _condition(value, arg):
+    for condition in value or ():
+        if condition.type == arg:
+            return condition
+    return None
+
+
+# Filters an expression can pipe a value through, each called with the value
+# and the text after the colon (None without one), e.g. "conditions|condition:Available|status"
+FILTERS = {
+    # Interned, since they mostly produce the same few values ("true", "7")
+    'str': lambda value, arg: sys.intern(str(value)),
+    'lower': lambda value, arg: sys.intern(str(value).lower()),
+    # Milliseconds, as the timestamps of the original collectors were, from
+    # Unix seconds (a field with the timestamp converter); 0 when unset
+    'timestamp_ms': _milliseconds,
+    'join': lambda value, arg: (',' if arg is None else arg).join(value or ()),
+    'default': _default,
+    'index': lambda value, arg: value[int(arg)],
+    'first': lambda value, arg: value[0] if value else None,
+    'condition': _condition,
+    'status': lambda value, arg: value.status if value is not None else None,
+    # 1 for a "True" status (in any case), else 0
+    'is_true': lambda value, arg: 1 if value is not None and str(value).lower() == 'true' else 0,
+}
+
+
+def compile_expression(expression, fields, functions):
+    """A function of a record computing `expression`.
+
+    A number is a constant. Otherwise the expression is a source, a record
+    field or "@name" for `functions[name]` called with the whole record,
+    followed by any number of "|filter" or "|filter:argument" from FILTERS.
+    Unknown fields, functions and filters raise ValueError here rather than
+    at the first refresh.
+    """
+    if isinstance(expression, (int, float)) and not isinstance(expression, bool):
+        return lambda rec: expression
+    source, *steps = str(expression).split('|')
+    if source.startswith('@'):
+        if source[1:] not in functions:
+            raise ValueError(f"unknown function {source!r} in {expression!r}")
+        get = functions[source[1:]]
+    else:
+        if source not in fields:
+            raise ValueError(f"unknown field {source!r} in {expression!r}")
+        index = fields.index(source)
+        get = lambda rec: rec[index]  # noqa: E731
+    for step in steps:
+        name, colon, arg = step.partition(':')
+        if name not in FILTERS:
+            raise ValueError(f"unknown filter {name!r} in {expression!r}")
+        get = _pipe(get, FILTERS[name], arg if colon else None)
+    return get
+
+
+def _pipe(get, apply, arg):
+    return lambda rec: apply(get(rec), arg)
+
+
+def compile_series(samplers):
+    def series(rec):
+        for sampler in samplers:
+            yield sampler(rec)
+
+    return series
+
+
+def compile_kind(spec, functions=None, interval=30, rollups=None):
+    """Compile one entry of a kind table into a Kind.
+
+    `spec` is a dict (as written in Python or loaded from YAML) with:
+
+      plural, group, version  where the kind is listed
+      kind                    name of its record type
+      fields                  record attribute -> dotted path, [path, default]
+                              or [path, default, converter from CONVERTERS]
+                              (see projection.Fields); at least name and namespace
+      metrics                 list of {name, help, labels: {label: expression},
+                              value: expression (default 1)}, see compile_expression
+      interval                poll mode refresh interval in seconds (default `interval`)
+      rollups                 Cluster attributes given every record after a change;
+                              with `rollups` (name -> (plurals it reads or None
+                              for any, fields it needs)) only those it allows
+      namespaced              whether the kind is namespaced (default true)
+      aggregates              list of {name, help, source: metric name, labels:
+                              [label]} counting the source's samples in
+                              aggregate-only mode; omitted to keep the metrics
+
+    Label and value expressions are compiled into plain functions of the
+    record here, once, so refreshes never look at the spec again.
+    """
+    functions = functions or {}
+    plural = spec['plural']
+    try:
+        fields = Fields(spec['kind'], {attr: _field(path) for attr, path in spec['fields'].items()})
+        names = fields.record._fields
+        metrics = []
+        samplers = []
+        for entry in spec.get('metrics', ()):
+            labels = {label: compile_expression(expression, names, functions)
+                      for label, expression in entry.get('labels', {}).items()}
+            metric = Metric(entry['name'], entry.get('help', entry['name']), list(labels))
+            metrics.append(metric)
+            samplers.append(metric.sampler(labels, compile_expression(entry.get('value', 1), names, functions)))
+        for name in spec.get('rollups', ()):
+            _check_rollup(name, plural, names, rollups)
+        by_name = {metric.name: metric for metric in metrics}
+        aggregates = spec.get('aggregates')
+        if aggregates is not None:
+            aggregates = [CountBy(by_name[entry['source']], entry['name'], entry.get('help', entry['name']),
+                                  entry['labels'])
+                          for entry in aggregates]
+    except KeyError as e:
+        raise ValueError(f"kind {plural}: missing {e}") from None
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"kind {plural}: {e}") from None
+    return Kind(plural, spec['group'], spec['version'], fields, metrics, compile_series(tuple(samplers)),
+                spec.get('interval', interval), tuple(spec.get('rollups', ())), spec.get('namespaced', True),
+                aggregates)
+
+
+def _check_rollup(name, plural, fields, rollups):
+    if rollups is None:
+        return
+    if name not in rollups:
+        raise ValueError(f"unknown rollup {name!r}")
+    plurals, needed = rollups[name]
+    if plurals is not None and plural not in plurals:
+        raise ValueError(f"rollup {name!r} only reads {', '.join(plurals)}")
+    missing = [field for field in needed if field not in fields]
+    if missing:
+        raise ValueError(f"rollup {name!r} needs fields {', '.join(missing)}")
+
+
+def _field(spec):
+    if isinstance(spec, str):
+        return spec
+    spec = list(spec)
+    if len(spec) > 2 and isinstance(spec[2], str):
+        if spec[2] not in CONVERTERS:
+            raise ValueError(f"unknown converter {spec[2]!r}")
+        spec[2] = CONVERTERS[spec[2]]
+    return tuple(spec)
+
+
+def load_table(path):
+    """The kind table in the YAML file at `path`: a list of compile_kind specs,
+    or a mapping with such a list under `kinds`."""
+    import yaml
+
+    with open(path) as f:
+        table = yaml.safe_load(f) or []
+    if isinstance(table, dict):
+        table = table.get('kinds', [])
+    return table
+
+
+def merge_tables(table, overrides):
+    """`table` with each kind in `overrides` replacing the one of the same plural, or added after them."""
+    merged = {spec['plural']: spec for spec in table}
+    merged.update((spec['plural'], spec) for spec in overrides)
+    return list(merged.values())
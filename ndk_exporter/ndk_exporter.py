@@ -1,557 +1,835 @@
+import os
+import threading
 import time
-import datetime
+import concurrent.futures
+import itertools
 from kubernetes import client, config
-from prometheus_client import start_http_server, Gauge
-
-# Load in-cluster config
-config.load_incluster_config()
-api = client.CustomObjectsApi()
-
-# Define metrics
-application_info = Gauge(
-    'ndk_application_info',
-    'Information about NDK Applications',
-    ['app_name', 'namespace']
-)
-
-application_snapshot_info = Gauge(
-    'ndk_application_snapshot_info',
-    'Information about NDK Application Snapshots',
-    ['snapshot_name', 'namespace', 'application', 'ready_to_use']
-)
-
-application_snapshot_creation_timestamp = Gauge(
-    'ndk_application_snapshot_creation_timestamp_seconds',
-    'Creation time of ApplicationSnapshot as Unix timestamp',
-    ['snapshot_name', 'namespace']
-)
-
-application_snapshot_expiration_timestamp = Gauge(
-    'ndk_application_snapshot_expiration_timestamp_seconds',
-    'Expiration time of ApplicationSnapshot as Unix timestamp',
-    ['snapshot_name', 'namespace']
-)
-
-
-application_restore_info = Gauge(
-    'ndk_application_restore_info',
-    'Information about NDK Application Restores',
-    ['restore_name', 'namespace', 'snapshot_name', 'completed', 'start_time', 'end_time']
-)
-
-application_restore_start_timestamp = Gauge(
-    'ndk_application_restore_start_timestamp_seconds',
-    'Start time of ApplicationRestore as Unix timestamp',
-    ['restore_name', 'namespace']
-)
-
-application_restore_end_timestamp = Gauge(
-    'ndk_application_restore_end_timestamp_seconds',
-    'End time of ApplicationRestore as Unix timestamp',
-    ['restore_name', 'namespace']
-)
-
-remote_info = Gauge(
-    'ndk_remote_info', 
-    'Status of remote resources', 
-    ['remote_name', 'clusterName', 'ndkServiceIp', 'status'])
-
-replicationtarget_info = Gauge(
-    'ndk_replicationtarget_info', 
-    'Information about the replication target resources', 
-    labelnames=['replicationtarget_name', 'source_namespace', 'remote_namespace', 'remotename', 'status']
-)
-
-application_snapshot_replication_info = Gauge(
-    'ndk_applicationsnapshotreplication_info',
-    'Information about ApplicationSnapshotReplication resources',
-    labelnames=['application_snapshot_replication_name', 'namespace', 'applicationsnapshotname', 'replicationtargetname', 'available_status']
-)
-
-jobscheduler_info = Gauge(
-    'ndk_jobscheduler_info',
-    'Information about JobScheduler CRs with schedule type and value',
-    labelnames=['jobscheduler_name', 'namespace', 'schedule_type', 'schedule_value', 'timezone']
-)
-
-# One gauge for basic plan info
-protectionplan_info = Gauge(
-    'ndk_protectionplan_info',
-    'Protection plan info including retention count',
-    ['protectionplan_name', 'namespace', 'retention_count']
-)
-
-# Two condition status gauges
-protectionplan_available_status = Gauge(
-    'ndk_protectionplan_status_available',
-    'Availability condition of the ProtectionPlan (1 for True, 0 for False)',
-    ['protectionplan_name', 'namespace']
-)
-
-protectionplan_degraded_status = Gauge(
-    'ndk_protectionplan_status_degraded',
-    'Degraded condition of the ProtectionPlan (1 for True, 0 for False)',
-    ['protectionplan_name', 'namespace']
-)
-
-# Metric to expose app protection plan info
-appprotection_plan_info = Gauge(
-    'ndk_appprotection_plan_info',
-    'Information about AppProtectionPlans',
-    ['appprotectionplan_name', 'namespace', 'protectionplans']
-)
-
-# Conditions
-appprotection_plan_available_status = Gauge(
-    'ndk_appprotection_plan_status_available',
-    'Availability condition of the AppProtectionPlan (1 for True, 0 for False)',
-    ['appprotectionplan_name', 'namespace']
-)
-
-appprotection_plan_degraded_status = Gauge(
-    'ndk_appprotection_plan_status_degraded',
-    'Degraded condition of the AppProtectionPlan (1 for True, 0 for False)',
-    ['appprotectionplan_name', 'namespace']
-)
-
-def to_unix_timestamp(timestr):
+from prometheus_client import REGISTRY, CollectorRegistry
+
+from exposition import ExpositionCache, start_exposition_server
+from federation import Federation, parse_kubeconfigs
+from cardinality import NamespaceFilter, apply_caps, parse_patterns
+from informer import Informer
+from scheduler import KindSchedule
+from latency import LatencyTracker, RestoreLatency, SnapshotReadyLatency
+from listing import PARTIAL_LIST_ACCEPT, ContinueExpired, ListPager, json_decoder
+from mapping import compile_kind, load_table, merge_tables
+from relationships import METRICS as RELATIONSHIP_METRICS, TABLES as RELATIONSHIP_TABLES, RelationshipIndex
+from rollups import METRICS as ROLLUP_METRICS, SnapshotRollup
+from selfmetrics import ClusterMetrics, render_duration, scrapes
+from series import SeriesCache
+from sharding import Shard, ShardLabel, shard_from_env
+from schedules import METRICS as SCHEDULE_METRICS, TABLES as SCHEDULE_TABLES, ScheduleTracker
+from transitions import METRICS as TRANSITION_METRICS, ConditionTracker
+from warmstart import StateWriter, load as load_state
+from snapshot import SnapshotCollector
+
+# "poll" lists every kind each interval, "informer" lists once and then follows
+# WATCH streams so the apiserver only pays for changes.
+MODE = os.environ.get('NDK_EXPORTER_MODE', 'poll')
+POLL_INTERVAL = 30
+
+
+def parse_overrides(value):
+    """Parse "plural=seconds,plural=seconds" into a dict of floats."""
+    overrides = {}
+    for entry in value.split(','):
+        if '=' in entry:
+            name, seconds = entry.split('=', 1)
+            overrides[name.strip()] = float(seconds)
+    return overrides
+
+
+# How long a single kind may take before the cycle stops waiting for it and
+# keeps serving its last good data, e.g. NDK_KIND_TIMEOUTS="applicationsnapshots=60"
+KIND_TIMEOUT = float(os.environ.get('NDK_KIND_TIMEOUT', '20'))
+KIND_TIMEOUTS = parse_overrides(os.environ.get('NDK_KIND_TIMEOUTS', ''))
+
+# Per-kind overrides of the refresh intervals in KINDS, e.g. NDK_KIND_INTERVALS="remotes=60"
+KIND_INTERVALS = parse_overrides(os.environ.get('NDK_KIND_INTERVALS', ''))
+
+# Objects per LIST request; 0 fetches each kind in a single unpaginated LIST
+PAGE_SIZE = int(os.environ.get('NDK_LIST_PAGE_SIZE', '500'))
+# How many times a chunked LIST is restarted from scratch when its continue token expires
+LIST_ATTEMPTS = 3
+
+# Decode list and watch bodies with orjson (when installed) instead of the json
+# module; bodies are always read raw so their size can be counted
+FAST_JSON = os.environ.get('NDK_FAST_JSON', '').lower() in ('1', 'true', 'yes')
+decode = json_decoder(FAST_JSON)
+
+# Cardinality controls (see cardinality.py). Only objects in namespaces matching
+# NDK_NAMESPACES (if set) and not NDK_EXCLUDE_NAMESPACES are exported, e.g.
+# NDK_EXCLUDE_NAMESPACES="kube-*,test-*"
+NAMESPACES = NamespaceFilter(parse_patterns(os.environ.get('NDK_NAMESPACES', '')),
+                             parse_patterns(os.environ.get('NDK_EXCLUDE_NAMESPACES', '')))
+# Most series any one metric may have (0 for no limit), with per-metric
+# overrides, e.g. NDK_MAX_SERIES_PER_METRIC="ndk_application_snapshot_info=20000"
+MAX_SERIES = int(os.environ.get('NDK_MAX_SERIES', '0'))
+MAX_SERIES_PER_METRIC = parse_overrides(os.environ.get('NDK_MAX_SERIES_PER_METRIC', ''))
+# Export per-namespace counts instead of a series per snapshot, restore and replication
+AGGREGATE_ONLY = os.environ.get('NDK_AGGREGATE_ONLY', '').lower() in ('1', 'true', 'yes')
+# Whether ndk_application_restore_info carries start_time and end_time labels;
+# the same times are always exported as ndk_application_restore_*_timestamp_seconds values
+TIMESTAMP_LABELS = os.environ.get('NDK_TIMESTAMP_LABELS', 'true').lower() in ('1', 'true', 'yes')
+# How long after a JobScheduler run an ApplicationSnapshot for it may take to appear
+SCHEDULE_GRACE = float(os.environ.get('NDK_SCHEDULE_GRACE', '600'))
+# YAML file of kinds to export on top of KIND_TABLE, or in place of its kinds
+# of the same plural (see mapping.compile_kind), e.g. for a newer NDK API version
+KINDS_FILE = os.environ.get('NDK_KINDS_FILE', '')
+# This replica's share of the namespaces when NDK_SHARDS replicas split them
+# (see Shard), or None when one replica exports everything
+SHARD = shard_from_env(os.environ)
+# Whether this replica exports the cluster-scoped kinds (Remotes); every shard
+# still lists them to follow references into them
+CLUSTER_SCOPED = SHARD is None or SHARD.primary
+
+# Kubeconfigs of the clusters to export, e.g. NDK_KUBECONFIGS="east=/config/east,west=/config/west"
+# (see parse_kubeconfigs); without it the exporter exports the cluster it runs in
+KUBECONFIGS = os.environ.get('NDK_KUBECONFIGS', '')
+
+# Where the exporter saves its objects and derived state (see warmstart.py) so
+# a restart serves the last known metrics at once, marked stale, instead of
+# nothing until every kind has been listed again; unset to start cold
+STATE_FILE = os.environ.get('NDK_STATE_FILE', '')
+# Most often the state is saved, and how old a saved state may be to be used
+STATE_INTERVAL = float(os.environ.get('NDK_STATE_INTERVAL', '60'))
+STATE_MAX_AGE = float(os.environ.get('NDK_STATE_MAX_AGE', '3600'))
+
+# The clusters being exported (see Cluster). Created in __main__ so importing
+# the module has no side effects.
+clusters = []
+
+# /metrics is served from bodies rendered once per refresh cycle (see render)
+federation = Federation(REGISTRY, clusters)
+exposition = ExpositionCache(ShardLabel(federation, SHARD) if SHARD else federation)
+
+# Saves the state in the background when STATE_FILE is set (see __main__)
+state_writer = None
+
+
+def jobscheduler_schedule(rec):
+    """(schedule_type, schedule_value) of a JobScheduler for ndk_jobscheduler_info."""
+    if rec.interval is not None:
+        return 'interval', f"{rec.interval.get('minutes', 'unknown')}m"
+    if rec.daily is not None:
+        return 'daily', rec.daily.get('time', 'unknown')
+    if rec.weekly is not None:
+        return 'weekly', f"{rec.weekly.get('days', 'unknown')} at {rec.weekly.get('time', 'unknown')}"
+    if rec.monthly is not None:
+        return 'monthly', f"{rec.monthly.get('dates', 'unknown')} at {rec.monthly.get('time', 'unknown')}"
+    if rec.cron_schedule is not None:
+        return 'cron', rec.cron_schedule
+    if rec.start_time is not None:
+        return 'one-time', rec.start_time
+    return 'unknown', 'unknown'
+
+
+# Functions label and value expressions in the kind table can call as "@name"
+FUNCTIONS = {
+    'jobscheduler_schedule': jobscheduler_schedule,
+}
+
+DATASERVICES = 'dataservices.nutanix.com'
+
+# Every NDK kind and the metrics it feeds (see mapping.compile_kind for the
+# format). The fields are all the exporter keeps of each object; rollups and
+# trackers read them by name, so renaming one means updating them too.
+# NDK_KINDS_FILE can add kinds or replace these one plural at a time.
+KIND_TABLE = [
+    {
+        'plural': 'applications', 'group': DATASERVICES, 'version': 'v1alpha1', 'kind': 'Application',
+        'interval': 60, 'rollups': ['relationships'],
+        'fields': {
+            'name': ['metadata.name', 'unknown'],
+            'namespace': ['metadata.namespace', 'default', 'intern'],
+        },
+        'metrics': [
+            {'name': 'ndk_application_info', 'help': 'Information about NDK Applications',
+             'labels': {'app_name': 'name', 'namespace': 'namespace'}},
+        ],
+        'aggregates': [
+            {'name': 'ndk_applications', 'help': 'Number of NDK Applications per namespace',
+             'source': 'ndk_application_info', 'labels': ['namespace']},
+        ],
+    },
+    {
+        'plural': 'applicationsnapshots', 'group': DATASERVICES, 'version': 'v1alpha1', 'kind': 'ApplicationSnapshot',
+        'rollups': ['snapshot_rollup', 'relationships', 'schedules', 'snapshot_ready_latency'],
+        'fields': {
+            'name': 'metadata.name',
+            'namespace': ['metadata.namespace', None, 'intern'],
+            'application': ['spec.source.applicationRef.name', 'unknown', 'intern'],
+            'ready_to_use': ['status.readyToUse', False],
+            'creation_time': ['status.creationTime', None, 'timestamp'],
+            'expiration_time': ['status.expirationTime', None, 'timestamp'],
+            'uid': 'metadata.uid',
+            'created': ['metadata.creationTimestamp', None, 'timestamp'],
+        },
+        'metrics': [
+            {'name': 'ndk_application_snapshot_info', 'help': 'Information about NDK Application Snapshots',
+             'labels': {'snapshot_name': 'name', 'namespace': 'namespace', 'application': 'application',
+                        'ready_to_use': 'ready_to_use|lower'}},
+            {'name': 'ndk_application_snapshot_creation_timestamp_seconds',
+             'help': 'Creation time of ApplicationSnapshot as Unix timestamp',
+             'labels': {'snapshot_name': 'name', 'namespace': 'namespace'}, 'value': 'creation_time|timestamp_ms'},
+            {'name': 'ndk_application_snapshot_expiration_timestamp_seconds',
+             'help': 'Expiration time of ApplicationSnapshot as Unix timestamp',
+             'labels': {'snapshot_name': 'name', 'namespace': 'namespace'}, 'value': 'expiration_time|timestamp_ms'},
+        ],
+        # Covered by the per-application rollups
+        'aggregates': [],
+    },
+    {
+        'plural': 'applicationsnapshotrestores', 'group': DATASERVICES, 'version': 'v1alpha1',
+        'kind': 'ApplicationSnapshotRestore', 'rollups': ['restore_latency'],
+        'fields': {
+            'name': 'metadata.name',
+            'namespace': ['metadata.namespace', None, 'intern'],
+            'snapshot_name': ['spec.applicationSnapshotName', 'unknown'],
+            'completed': ['status.completed', False],
+            'start_time': ['status.startTime', None, 'timestamp'],
+            'finish_time': ['status.finishTime', None, 'timestamp'],
+            'uid': 'metadata.uid',
+        },
+        'metrics': [
+            {'name': 'ndk_application_restore_info', 'help': 'Information about NDK Application Restores',
+             'labels': {'restore_name': 'name', 'namespace': 'namespace', 'snapshot_name': 'snapshot_name',
+                        'completed': 'completed|lower',
+                        **({'start_time': 'start_time|timestamp_ms', 'end_time': 'finish_time|timestamp_ms'}
+                           if TIMESTAMP_LABELS else {})}},
+            {'name': 'ndk_application_restore_start_timestamp_seconds',
+             'help': 'Start time of ApplicationRestore as Unix timestamp',
+             'labels': {'restore_name': 'name', 'namespace': 'namespace'}, 'value': 'start_time|timestamp_ms'},
+            {'name': 'ndk_application_restore_end_timestamp_seconds',
+             'help': 'End time of ApplicationRestore as Unix timestamp',
+             'labels': {'restore_name': 'name', 'namespace': 'namespace'}, 'value': 'finish_time|timestamp_ms'},
+        ],
+        'aggregates': [
+            {'name': 'ndk_application_restores',
+             'help': 'Number of NDK Application Restores per namespace by completion',
+             'source': 'ndk_application_restore_info', 'labels': ['namespace', 'completed']},
+        ],
+    },
+    {
+        'plural': 'remotes', 'group': DATASERVICES, 'version': 'v1alpha1', 'kind': 'Remote',
+        'interval': 120, 'namespaced': False,
+        'rollups': ['relationships'] + (['transitions'] if CLUSTER_SCOPED else []),
+        'fields': {
+            'name': ['metadata.name', 'unknown'],
+            'namespace': ['metadata.namespace', None, 'intern'],
+            'cluster_name': ['spec.clusterName', 'unknown'],
+            'ndk_service_ip': ['spec.ndkServiceIp', 'unknown'],
+            'conditions': ['status.conditions', (), 'conditions'],
+        },
+        'metrics': [
+            {'name': 'ndk_remote_info', 'help': 'Status of remote resources',
+             'labels': {'remote_name': 'name', 'clusterName': 'cluster_name', 'ndkServiceIp': 'ndk_service_ip',
+                        'status': 'conditions|first|status|default:unknown'}},
+        ],
+    },
+    {
+        'plural': 'replicationtargets', 'group': DATASERVICES, 'version': 'v1alpha1', 'kind': 'ReplicationTarget',
+        'interval': 120, 'rollups': ['relationships', 'transitions'],
+        'fields': {
+            'name': ['metadata.name', 'unknown'],
+            'namespace': ['metadata.namespace', 'unknown', 'intern'],
+            'namespace_name': ['spec.namespaceName', 'unknown'],
+            'remote_name': ['spec.remoteName', 'unknown', 'intern'],
+            'conditions': ['status.conditions', (), 'conditions'],
+        },
+        'metrics': [
+            {'name': 'ndk_replicationtarget_info', 'help': 'Information about the replication target resources',
+             'labels': {'replicationtarget_name': 'name', 'source_namespace': 'namespace',
+                        'remote_namespace': 'namespace_name', 'remotename': 'remote_name',
+                        'status': 'conditions|first|status|default:unknown'}},
+        ],
+    },
+    {
+        'plural': 'applicationsnapshotreplications', 'group': DATASERVICES, 'version': 'v1alpha1',
+        'kind': 'ApplicationSnapshotReplication', 'rollups': ['relationships'],
+        'fields': {
+            'name': ['metadata.name', 'unknown'],
+            'namespace': ['metadata.namespace', 'unknown', 'intern'],
+            'snapshot_name': ['spec.applicationSnapshotName', 'unknown'],
+            'replication_target_name': ['spec.replicationTargetName', 'unknown', 'intern'],
+            'conditions': ['status.conditions', (), 'conditions'],
+        },
+        'metrics': [
+            {'name': 'ndk_applicationsnapshotreplication_info',
+             'help': 'Information about ApplicationSnapshotReplication resources',
+             'labels': {'application_snapshot_replication_name': 'name', 'namespace': 'namespace',
+                        'applicationsnapshotname': 'snapshot_name', 'replicationtargetname': 'replication_target_name',
+                        'available_status': 'conditions|condition:Available|status|default:unknown'}},
+        ],
+        'aggregates': [
+            {'name': 'ndk_applicationsnapshotreplications',
+             'help': 'Number of ApplicationSnapshotReplications per namespace by availability',
+             'source': 'ndk_applicationsnapshotreplication_info', 'labels': ['namespace', 'available_status']},
+        ],
+    },
+    {
+        'plural': 'jobschedulers', 'group': 'scheduler.nutanix.com', 'version': 'v1alpha1', 'kind': 'JobScheduler',
+        'interval': 300, 'rollups': ['schedules'],
+        'fields': {
+            'name': ['metadata.name', 'unknown'],
+            'namespace': ['metadata.namespace', 'default', 'intern'],
+            'timezone': ['spec.timeZoneName', 'unknown', 'intern'],
+            'interval': 'spec.interval',
+            'daily': 'spec.daily',
+            'weekly': 'spec.weekly',
+            'monthly': 'spec.monthly',
+            'cron_schedule': 'spec.cronSchedule',
+            'start_time': 'spec.startTime',
+            'start_at': ['spec.startTime', None, 'timestamp'],
+            'created': ['metadata.creationTimestamp', None, 'timestamp'],
+        },
+        'metrics': [
+            {'name': 'ndk_jobscheduler_info', 'help': 'Information about JobScheduler CRs with schedule type and value',
+             'labels': {'jobscheduler_name': 'name', 'namespace': 'namespace',
+                        'schedule_type': '@jobscheduler_schedule|index:0',
+                        'schedule_value': '@jobscheduler_schedule|index:1', 'timezone': 'timezone'}},
+        ],
+    },
+    {
+        'plural': 'protectionplans', 'group': DATASERVICES, 'version': 'v1alpha1', 'kind': 'ProtectionPlan',
+        'interval': 300, 'rollups': ['relationships', 'transitions', 'schedules'],
+        'fields': {
+            'name': ['metadata.name', 'unknown'],
+            'namespace': ['metadata.namespace', 'default', 'intern'],
+            'retention_count': ['spec.retentionPolicy.retentionCount', '0'],
+            'schedule_name': 'spec.scheduleName',
+            'conditions': ['status.conditions', (), 'conditions'],
+        },
+        'metrics': [
+            {'name': 'ndk_protectionplan_info', 'help': 'Protection plan info including retention count',
+             'labels': {'protectionplan_name': 'name', 'namespace': 'namespace', 'retention_count': 'retention_count'}},
+            {'name': 'ndk_protectionplan_status_available',
+             'help': 'Availability condition of the ProtectionPlan (1 for True, 0 for False)',
+             'labels': {'protectionplan_name': 'name', 'namespace': 'namespace'},
+             'value': 'conditions|condition:Available|status|is_true'},
+            {'name': 'ndk_protectionplan_status_degraded',
+             'help': 'Degraded condition of the ProtectionPlan (1 for True, 0 for False)',
+             'labels': {'protectionplan_name': 'name', 'namespace': 'namespace'},
+             'value': 'conditions|condition:Degraded|status|is_true'},
+        ],
+    },
+    {
+        'plural': 'appprotectionplans', 'group': DATASERVICES, 'version': 'v1alpha1', 'kind': 'AppProtectionPlan',
+        'interval': 120, 'rollups': ['relationships', 'transitions', 'schedules'],
+        'fields': {
+            'name': ['metadata.name', 'unknown'],
+            'namespace': ['metadata.namespace', 'default', 'intern'],
+            'protection_plans': ['spec.protectionPlanNames', []],
+            'application': ['spec.applicationName', None, 'intern'],
+            'conditions': ['status.conditions', (), 'conditions'],
+        },
+        'metrics': [
+            {'name': 'ndk_appprotection_plan_info', 'help': 'Information about AppProtectionPlans',
+             'labels': {'appprotectionplan_name': 'name', 'namespace': 'namespace',
+                        'protectionplans': 'protection_plans|join|default:none'}},
+            {'name': 'ndk_appprotection_plan_status_available',
+             'help': 'Availability condition of the AppProtectionPlan (1 for True, 0 for False)',
+             'labels': {'appprotectionplan_name': 'name', 'namespace': 'namespace'},
+             'value': 'conditions|condition:Available|status|is_true'},
+            {'name': 'ndk_appprotection_plan_status_degraded',
+             'help': 'Degraded condition of the AppProtectionPlan (1 for True, 0 for False)',
+             'labels': {'appprotectionplan_name': 'name', 'namespace': 'namespace'},
+             'value': 'conditions|condition:Degraded|status|is_true'},
+        ],
+    },
+]
+
+# The rollups a kind can feed, by Cluster attribute: the kinds each one reads
+# (None for any) and the record fields it needs of them besides name and namespace
+ROLLUPS = {
+    'snapshot_rollup': (('applicationsnapshots',), ()),
+    'relationships': (tuple(RELATIONSHIP_TABLES), ()),
+    'transitions': (None, ('conditions',)),
+    'schedules': (tuple(SCHEDULE_TABLES) + ('jobschedulers',), ()),
+    'restore_latency': (('applicationsnapshotrestores',), ()),
+    'snapshot_ready_latency': (('applicationsnapshots',), ()),
+}
+
+KINDS = [compile_kind(spec, FUNCTIONS, POLL_INTERVAL, ROLLUPS)
+         for spec in merge_tables(KIND_TABLE, load_table(KINDS_FILE) if KINDS_FILE else [])]
+
+
+def kind_exports(kind):
+    if not kind.namespaced and not CLUSTER_SCOPED:
+        return ()
+    if AGGREGATE_ONLY and kind.aggregates is not None:
+        return kind.aggregates
+    return kind.metrics
+
+
+apply_caps([metric for kind in KINDS for metric in kind.metrics] +
+           [count for kind in KINDS for count in kind.aggregates or ()] + list(ROLLUP_METRICS) +
+           list(RELATIONSHIP_METRICS) + list(TRANSITION_METRICS) + list(SCHEDULE_METRICS),
+           MAX_SERIES, MAX_SERIES_PER_METRIC)
+
+class Cluster:
+    """One Kubernetes cluster: its API client and everything exported from it.
+
+    Each cluster has its own series caches, rollups across kinds and
+    exporter metrics, all registered on `registry`. Clusters are refreshed
+    by their own loop (see poll_loop and informer_loop) on their own
+    schedules, so a slow or unreachable apiserver only leaves its own
+    cluster's series stale.
+
+    `api` is the CustomObjectsApi every refresh and informer uses. Anything
+    with the same list_cluster_custom_object signature can be used instead,
+    e.g. the stand-in in benchmarks/bench_cluster.py.
+    """
+
+    def __init__(self, name, api, registry=REGISTRY):
+        self.name = name
+        self.api = api
+        self.registry = registry
+        self.metrics = ClusterMetrics(registry)
+
+        # Every NDK metric is served from here; each kind builds complete
+        # families and publishes them in one swap so scrapes never see a
+        # half-rebuilt kind.
+        self.snapshot = SnapshotCollector()
+        # Per-application rollups of the ApplicationSnapshots (RPO and expiry)
+        self.snapshot_rollup = SnapshotRollup(self.metrics.series_dropped)
+        # Replication chain health and dangling references across kinds
+        self.relationships = RelationshipIndex(self.metrics.series_dropped)
+        # Transition counts and time in state for every condition of the
+        # configuration kinds (not replications, which number in the tens of thousands)
+        self.transitions = ConditionTracker(self.metrics.series_dropped)
+        # Next and previous JobScheduler runs, and applications whose scheduled snapshot did not appear
+        self.schedules = ScheduleTracker(SCHEDULE_GRACE, self.metrics.series_dropped)
+        for collector in (self.snapshot, self.snapshot_rollup, self.relationships, self.transitions,
+                          self.schedules):
+            registry.register(collector)
+        self.restore_latency = RestoreLatency(registry)
+        # Refreshes (or in informer mode metrics updates) come at most this far apart
+        ready_interval = POLL_INTERVAL if MODE == 'informer' else next(
+            (kind_interval(kind) for kind in KINDS if kind.plural == 'applicationsnapshots'), POLL_INTERVAL)
+        self.snapshot_ready_latency = SnapshotReadyLatency(registry, interval=ready_interval)
+
+        self.shard = Shard(SHARD.index, SHARD.count) if SHARD else None
+        # The namespaces exported: those NDK_NAMESPACES allows, of this replica's shard
+        self.keep = NamespaceFilter(NAMESPACES.allow, NAMESPACES.deny, self.shard.owns if self.shard else None)
+        # Series already computed for each kind, so a refresh only redoes changed objects
+        self.caches = {kind.plural: SeriesCache(kind.metrics, kind.series, kind_exports(kind), self.keep or None,
+                                                self.metrics.series_dropped)
+                       for kind in KINDS}
+        self.rollups = {kind.plural: tuple(self._rollup(name, kind.plural) for name in kind.rollups)
+                        for kind in KINDS}
+        # Kinds whose cache holds a complete list, from a refresh or a saved state
+        self.loaded = set()
+        # Informer mode: the informer of each kind
+        self.informers = {kind.plural: None for kind in KINDS}
+        # Informer mode: saved informer stores by plural, taken by the informers as they start
+        self.restored = {}
+
+    def _rollup(self, name, plural):
+        rollup = getattr(self, name)
+        # Collectors spanning several kinds take each kind's records through a Table
+        return rollup.table(plural) if hasattr(rollup, 'table') else rollup
+
+
+def create_api(kubeconfig=None):
+    """A CustomObjectsApi with its own connection pool, for the cluster in `kubeconfig`
+    or, without one, the cluster the exporter runs in."""
+    configuration = client.Configuration()
+    if kubeconfig is None:
+        config.load_incluster_config(client_configuration=configuration)
+    else:
+        config.load_kube_config(config_file=kubeconfig, client_configuration=configuration)
+    # Every kind is listed with one request at a time (its namespaces one
+    # after the other when sharded), all kinds at once, and in informer mode
+    # each is also watched, so size the shared pool to never make a request
+    # queue for a connection.
+    configuration.connection_pool_maxsize = 2 * len(KINDS)
+    return client.CustomObjectsApi(client.ApiClient(configuration))
+
+
+def list_namespaces(api):
+    """The names of every namespace in the cluster."""
+    core = client.CoreV1Api(api.api_client)
+    raw = core.list_namespace(_headers={'Accept': PARTIAL_LIST_ACCEPT}, _preload_content=False)
     try:
-        dt = datetime.datetime.fromisoformat(timestr.replace("Z", "+00:00"))
-        return int(dt.timestamp() * 1000)
-    except Exception:
-        return 0
+        return [item['metadata']['name'] for item in decode(raw.data).get('items', [])]
+    finally:
+        raw.release_conn()
 
-def application_collect():
-    group = 'dataservices.nutanix.com'
-    version = 'v1alpha1'
-    plural = 'applications'
 
-    try:
-        resp = api.list_cluster_custom_object(group, version, plural)
-        application_info.clear() 
-
-        for item in resp.get('items', []):
-            metadata = item.get('metadata', {})
-            app_name = metadata.get('name', 'unknown')
-            namespace = metadata.get('namespace', 'default')
-
-            # Set the application_info metric
-            application_info.labels(app_name=app_name, namespace=namespace).set(1)
-
-            print(f"Retrieved application: {app_name}, Namespace: {namespace}")
-
-    except Exception as e:
-        print(f"Error collecting application data: {e}")
-
-def application_snapshot_collect():
-    try:
-        snapshots = api.list_cluster_custom_object(
-            group='dataservices.nutanix.com',
-            version='v1alpha1',
-            plural='applicationsnapshots'
-        )
-
-        # Clear all metrics
-        application_snapshot_info.clear()
-        application_snapshot_creation_timestamp.clear()
-        application_snapshot_expiration_timestamp.clear()
-
-        for item in snapshots.get('items', []):
-            metadata = item.get('metadata', {})
-            spec = item.get('spec', {})
-            status = item.get('status', {})
-
-            snapshotname = metadata.get('name')
-            namespace = metadata.get('namespace')
-            application_name = spec.get('source', {}).get('applicationRef', {}).get('name', 'unknown')
-            ready_to_use = str(status.get('readyToUse', False)).lower()
-
-            creation_raw = status.get('creationTime')
-            expiration_raw = status.get('expirationTime')
-
-            creation_ts = to_unix_timestamp(creation_raw) if creation_raw else 0
-            expiration_ts = to_unix_timestamp(expiration_raw) if expiration_raw else 0
-
-            # Set metrics
-            application_snapshot_info.labels(
-                snapshot_name=snapshotname,
-                namespace=namespace,
-                application=application_name,
-                ready_to_use=ready_to_use
-            ).set(1)
-
-            application_snapshot_creation_timestamp.labels(
-                snapshot_name=snapshotname,
-                namespace=namespace
-            ).set(creation_ts)
-
-            application_snapshot_expiration_timestamp.labels(
-                snapshot_name=snapshotname,
-                namespace=namespace
-            ).set(expiration_ts)
-
-    except Exception as e:
-        print(f"Error collecting snapshot data: {e}")
-
-
-def application_restore_collect():
-    try:
-        # Fetch ApplicationSnapshotRestore resources
-        restores = api.list_cluster_custom_object(
-            group='dataservices.nutanix.com',
-            version='v1alpha1',
-            plural='applicationsnapshotrestores'  # Correct plural name for the resource
-        )
-
-        # Clear any previous metrics
-        application_restore_info.clear()
-        application_restore_start_timestamp.clear()
-        application_restore_end_timestamp.clear()
-
-        # Process each restore resource
-        for item in restores.get('items', []):
-            metadata = item.get('metadata', {})
-            spec = item.get('spec', {})
-            status = item.get('status', {})
-
-            # Extract relevant fields
-            restore_name = metadata.get('name')  # Restore name
-            namespace = metadata.get('namespace')  # Namespace
-            snapshot_name = spec.get('applicationSnapshotName', 'unknown')  # Snapshot name from spec
-            completed = str(status.get('completed', False)).lower()  # Whether the restore is completed
-
-            # Extract start and finish times from status
-            start_raw = status.get('startTime')
-            finish_raw = status.get('finishTime')
-
-            # Convert start and finish times to Unix timestamps
-            start_ts = to_unix_timestamp(start_raw) if start_raw else 0
-            finish_ts = to_unix_timestamp(finish_raw) if finish_raw else 0
-
-
-            # Set the application_restore_info metric
-            application_restore_info.labels(
-                restore_name=restore_name,
-                namespace=namespace,
-                snapshot_name=snapshot_name,
-                completed=completed,
-                start_time=str(start_ts),
-                end_time=str(finish_ts)
-            ).set(1)
-
-            # Set the start and end time timestamps
-            application_restore_start_timestamp.labels(
-                restore_name=restore_name,
-                namespace=namespace
-            ).set(start_ts)
-
-            application_restore_end_timestamp.labels(
-                restore_name=restore_name,
-                namespace=namespace
-            ).set(finish_ts)
-
-    except Exception as e:
-        print(f"Error collecting restore data: {e}")
-
-def remote_collect():
-    group = 'dataservices.nutanix.com'
-    version = 'v1alpha1'
-    plural = 'remotes'
-
-    try:
-        # Retrieve the list of Remote resources
-        resp = api.list_cluster_custom_object(group, version, plural)
-        
-        # Clear previous data
-        remote_info.clear()
-
-        # Iterate through the items in the response (which is a list of Remote objects)
-        for item in resp.get('items', []):
-            metadata = item.get('metadata', {})
-            spec = item.get('spec', {})
-            status_conditions = item.get('status', {}).get('conditions', [])
-
-            name = metadata.get('name', 'unknown')
-            cluster_name = spec.get('clusterName', 'unknown')
-            ndk_service_ip = spec.get('ndkServiceIp', 'unknown')
-
-            # Extract the status from the first condition (if available)
-            status = 'unknown'
-            if status_conditions:
-                status_condition = status_conditions[0]  # Get the first condition
-                status = status_condition.get('status', 'unknown')  # Extract the status
-
-            # Set the metric for the remote resource
-            remote_info.labels(remote_name= name, clusterName=cluster_name, ndkServiceIp=ndk_service_ip, status=status).set(1)
-    
-    except Exception as e:
-        print(f"Error collecting remote data: {e}")
+def kind_namespaces(cluster, kind):
+    """The namespaces poll mode lists a kind in, None standing for the whole cluster."""
+    if cluster.shard is None or not kind.namespaced:
+        return [None]
+    namespaces = cluster.shard.namespaces(lambda: list_namespaces(cluster.api),
+                                          NAMESPACES.allows if NAMESPACES else None)
+    cluster.metrics.shard_namespaces.set(len(namespaces))
+    return namespaces
 
 
-def replicationtarget_collect():
-    group = 'dataservices.nutanix.com'
-    version = 'v1alpha1'
-    plural = 'replicationtargets'
+def kind_timeout(plural):
+    return KIND_TIMEOUTS.get(plural, KIND_TIMEOUT)
 
-    try:
-        # Retrieve the list of ReplicationTarget resources
-        resp = api.list_cluster_custom_object(group, version, plural)
-        
-        # Clear previous data
-        replicationtarget_info.clear()
-
-        # Iterate through the items in the response (which is a list of ReplicationTarget objects)
-        for item in resp.get('items', []):
-            metadata = item.get('metadata', {})
-            spec = item.get('spec', {})
-            status_conditions = item.get('status', {}).get('conditions', [])
-
-            reptarget_name = metadata.get('name', 'unknown')
-            reptarget_namespace = metadata.get('namespace', 'unknown')
-            namespace_name = spec.get('namespaceName', 'unknown')
-            remote_name = spec.get('remoteName', 'unknown')
-
-            # Extract the status from the first condition (if available)
-            status = 'unknown'
-            if status_conditions:
-                status_condition = status_conditions[0]  # Get the first condition
-                status = status_condition.get('status', 'unknown')  # Extract the status
-
-            # Set the metric for the replication target resource
-            replicationtarget_info.labels(replicationtarget_name=reptarget_name, source_namespace=reptarget_namespace, remote_namespace=namespace_name, remotename=remote_name, status=status).set(1)
-    
-    except Exception as e:
-        print(f"Error collecting replication target data: {e}")
 
-def application_snapshot_replication_collect():
-    group = 'dataservices.nutanix.com'
-    version = 'v1alpha1'
-    plural = 'applicationsnapshotreplications'
+def kind_interval(kind):
+    return KIND_INTERVALS.get(kind.plural, kind.interval)
 
-    try:
-        # Retrieve the list of ApplicationSnapshotReplication resources
-        resp = api.list_cluster_custom_object(group, version, plural)
-
-        # Clear old metric values
-        application_snapshot_replication_info.clear()
-
-        for item in resp.get('items', []):
-            metadata = item.get('metadata', {})
-            spec = item.get('spec', {})
-            conditions = item.get('status', {}).get('conditions', [])
-
-            name = metadata.get('name', 'unknown')
-            namespace = metadata.get('namespace', 'unknown')
-            app_snap_name = spec.get('applicationSnapshotName', 'unknown')
-            replication_target_name = spec.get('replicationTargetName', 'unknown')
-
-            # Look for condition of type "Available"
-            available_status = 'unknown'
-            for condition in conditions:
-                if condition.get('type') == 'Available':
-                    available_status = condition.get('status', 'unknown')
-                    break
-
-            # Set the metric
-            application_snapshot_replication_info.labels(
-                application_snapshot_replication_name=name,
-                namespace=namespace,
-                applicationsnapshotname=app_snap_name,
-                replicationtargetname=replication_target_name,
-                available_status=available_status
-            ).set(1)
-
-    except Exception as e:
-        print(f"Error in application_snapshot_replication_collect: {e}")
 
-def jobscheduler_collect():
-    group = 'scheduler.nutanix.com'
-    version = 'v1alpha1'
-    plural = 'jobschedulers'
+def refresh(cluster, kind):
+    """List one kind of a cluster and publish its families if anything changed.
 
+    Returns whether anything changed. Errors are logged and counted and then
+    re-raised for the scheduler; the kind keeps serving the families from its
+    last good refresh.
+    """
+    plural = kind.plural
+    cache = cluster.caches[plural]
+    metrics = cluster.metrics
     try:
-        # Fetch all JobScheduler CRs
-        resp = api.list_cluster_custom_object(group, version, plural)
-
-        # Clear existing metrics
-        jobscheduler_info.clear()
-
-        for item in resp.get('items', []):
-            metadata = item.get('metadata', {})
-            spec = item.get('spec', {})
-
-            name = metadata.get('name', 'unknown')
-            namespace = metadata.get('namespace', 'default')
-            timezone = spec.get('timeZoneName', 'unknown')
-
-            # Determine schedule type and value
-            schedule_type = 'unknown'
-            schedule_value = 'unknown'
-
-            if 'interval' in spec:
-                schedule_type = 'interval'
-                schedule_value = f"{spec['interval'].get('minutes', 'unknown')}m"
-            elif 'daily' in spec:
-                schedule_type = 'daily'
-                schedule_value = spec['daily'].get('time', 'unknown')
-            elif 'weekly' in spec:
-                schedule_type = 'weekly'
-                days = spec['weekly'].get('days', 'unknown')
-                time = spec['weekly'].get('time', 'unknown')
-                schedule_value = f"{days} at {time}"
-            elif 'monthly' in spec:
-                schedule_type = 'monthly'
-                dates = spec['monthly'].get('dates', 'unknown')
-                time = spec['monthly'].get('time', 'unknown')
-                schedule_value = f"{dates} at {time}"
-            elif 'cronSchedule' in spec:
-                schedule_type = 'cron'
-                schedule_value = spec.get('cronSchedule', 'unknown')
-            elif 'startTime' in spec:
-                schedule_type = 'one-time'
-                schedule_value = spec.get('startTime', 'unknown')
-
-            # Set the metric with namespace
-            jobscheduler_info.labels(
-                jobscheduler_name=name,
-                namespace=namespace,
-                schedule_type=schedule_type,
-                schedule_value=schedule_value,
-                timezone=timezone
-            ).set(1)
-
+        started = time.monotonic()
+        list_seconds = 0.0
+        namespaces = kind_namespaces(cluster, kind)
+        for attempt in range(1, LIST_ATTEMPTS + 1):
+            # One list per namespace of this shard, read one after the other
+            pagers = [ListPager(cluster.api, kind.group, kind.version, plural, PAGE_SIZE, kind_timeout(plural),
+                                decode, kind.fields.metadata_only, namespace) for namespace in namespaces]
+            try:
+                # Only new and modified objects are projected into records
+                changed = cache.update(itertools.chain.from_iterable(pagers), kind.fields)
+                break
+            except ContinueExpired:
+                # The cache is only updated once the whole list has been read,
+                # so nothing from the expired snapshot is kept
+                if attempt == LIST_ATTEMPTS:
+                    raise
+                print(f"Continue token for {plural} expired, restarting the list")
+            finally:
+                list_seconds += sum(pager.fetch_seconds for pager in pagers)
+                metrics.objects_processed.labels(kind=plural).inc(sum(pager.items for pager in pagers))
+                metrics.response_bytes.labels(kind=plural).inc(sum(pager.bytes for pager in pagers))
+        if changed:
+            records = cache.records()
+            for rollup in cluster.rollups[plural]:
+                rollup.update(records)
+            cluster.snapshot.publish({plural: cache.families})
+        else:
+            checked(cluster, plural)
+        cluster.loaded.add(plural)
+        if changed:
+            state_changed()
+        metrics.refresh_duration.labels(kind=plural, phase='list').observe(list_seconds)
+        metrics.refresh_duration.labels(kind=plural, phase='process').observe(
+            time.monotonic() - started - list_seconds)
+        metrics.objects.labels(kind=plural).set(sum(pager.items for pager in pagers))
+        metrics.last_success.labels(kind=plural).set_to_current_time()
+        metrics.kind_stale.labels(kind=plural).set(0)
+        return changed
     except Exception as e:
-        print(f"Error in jobscheduler_collect: {e}")
-
-
-def protectionplan_collect():
-    group = 'dataservices.nutanix.com'
-    version = 'v1alpha1'
-    plural = 'protectionplans'
-
-    try:
-        # Fetch all ProtectionPlan CRs
-        resp = api.list_cluster_custom_object(group, version, plural)
-
-        # Clear existing metrics
-        protectionplan_info.clear()
-        protectionplan_available_status.clear()
-        protectionplan_degraded_status.clear()
-
-        for item in resp.get('items', []):
-            metadata = item.get('metadata', {})
-            spec = item.get('spec', {})
-            status = item.get('status', {})
-
-            name = metadata.get('name', 'unknown')
-            namespace = metadata.get('namespace', 'default')
-            retention_count = str(spec.get('retentionPolicy', {}).get('retentionCount', '0'))
-
-            # Set base info metric
-            protectionplan_info.labels(
-                protectionplan_name=name,
-                namespace=namespace,
-                retention_count=retention_count
-            ).set(1)
-
-            # Parse conditions
-            conditions = status.get('conditions', [])
-            available = 0
-            degraded = 0
-
-            for condition in conditions:
-                cond_type = condition.get('type', '')
-                cond_status = condition.get('status', '').lower()
-
-                if cond_type == 'Available':
-                    available = 1 if cond_status == 'true' else 0
-                elif cond_type == 'Degraded':
-                    degraded = 1 if cond_status == 'true' else 0
-
-            # Set condition metrics
-            protectionplan_available_status.labels(
-                protectionplan_name=name,
-                namespace=namespace
-            ).set(available)
-
-            protectionplan_degraded_status.labels(
-                protectionplan_name=name,
-                namespace=namespace
-            ).set(degraded)
-
-    except Exception as e:
-        print(f"Error in protectionplan_collect: {e}")
-
-def app_protectionplan_collect():
-    group = 'dataservices.nutanix.com'
-    version = 'v1alpha1'
-    plural = 'appprotectionplans'
-
-    try:
-        # Fetch all AppProtectionPlan CRs
-        resp = api.list_cluster_custom_object(group, version, plural)
-
-        # Clear existing metrics
-        appprotection_plan_info.clear()
-        appprotection_plan_available_status.clear()
-        appprotection_plan_degraded_status.clear()
-
-        for item in resp.get('items', []):
-            metadata = item.get('metadata', {})
-            spec = item.get('spec', {})
-            status = item.get('status', {})
-
-            name = metadata.get('name', 'unknown')
-            namespace = metadata.get('namespace', 'default')
-            protectionplans = spec.get('protectionPlanNames', [])
-            protectionplans_str = ",".join(protectionplans) if protectionplans else "none"
-
-            # Set base info metric
-            appprotection_plan_info.labels(
-                appprotectionplan_name=name,
-                namespace=namespace,
-                protectionplans=protectionplans_str
-            ).set(1)
-
-            # Conditions
-            conditions = status.get('conditions', [])
-            available = 0
-            degraded = 0
-
-            for condition in conditions:
-                cond_type = condition.get('type', '')
-                cond_status = condition.get('status', '').lower()
-
-                if cond_type == 'Available':
-                    available = 1 if cond_status == 'true' else 0
-                elif cond_type == 'Degraded':
-                    degraded = 1 if cond_status == 'true' else 0
-
-            # Set condition metrics
-            appprotection_plan_available_status.labels(
-                appprotectionplan_name=name,
-                namespace=namespace
-            ).set(available)
-
-            appprotection_plan_degraded_status.labels(
-                appprotectionplan_name=name,
-                namespace=namespace
-            ).set(degraded)
+        print(f"Error collecting {plural} data{cluster_suffix(cluster)}: {e}")
+        metrics.errors.labels(kind=plural, exception=type(e).__name__).inc()
+        metrics.kind_stale.labels(kind=plural).set(1)
+        raise
+
+
+def checked(cluster, plural):
+    """Tell the latency trackers fed by a kind that it is unchanged as of now."""
+    for rollup in cluster.rollups[plural]:
+        if isinstance(rollup, LatencyTracker):
+            rollup.checked()
+
+
+def cluster_suffix(cluster):
+    return f" from cluster {cluster.name}" if cluster.name else ''
+
+
+def state_changed():
+    if state_writer is not None:
+        state_writer.changed()
+
+
+def cluster_state(cluster):
+    """What restore_cluster needs to serve a cluster's metrics again after a restart.
+
+    Records are saved as plain tuples with their field names, since the
+    record classes Fields makes cannot be pickled. In informer mode each
+    informer's store is saved with its resourceVersion so its watch can
+    resume from there.
+    """
+    kinds = {}
+    for kind in KINDS:
+        plural = kind.plural
+        informer = cluster.informers[plural]
+        if informer is not None:
+            if not informer.synced:
+                continue
+            resource_version, items = informer.snapshot()
+            items = [(key, tuple(rec)) for key, rec in items]
+        elif plural in cluster.loaded:
+            resource_version = None
+            items = [((rec.namespace, rec.name), tuple(rec)) for rec in cluster.caches[plural].records()]
+        else:
+            continue
+        kinds[plural] = (kind.fields.record._fields, resource_version, items)
+    return {
+        'kinds': kinds,
+        'transitions': cluster.transitions.state(),
+        'latency': {name: getattr(cluster, name).state() for name in ('restore_latency', 'snapshot_ready_latency')},
+    }
+
+
+def gather_state():
+    return {'clusters': {cluster.name: cluster_state(cluster) for cluster in clusters}}
+
+
+def restore_cluster(cluster, saved):
+    """Serve a cluster's metrics from cluster_state() saved by an earlier run.
+
+    Every restored kind is marked stale until its first refresh, or in
+    informer mode until its watch has resumed or relisted. Kinds whose
+    fields changed since the state was saved are left to be listed.
+    """
+    cluster.transitions.restore(saved['transitions'])
+    for name, seen in saved['latency'].items():
+        getattr(cluster, name).restore(seen)
+    parts = {}
+    for kind in KINDS:
+        plural = kind.plural
+        fields, resource_version, items = saved['kinds'].get(plural, (None, None, ()))
+        if fields != kind.fields.record._fields:
+            continue
+        make = kind.fields.record._make
+        cache = cluster.caches[plural]
+        items = [(key, make(values)) for key, values in items]
+        records = [rec for _, rec in items]
+        # Only an informer can resume a watch from the saved store; poll mode lists anyway
+        if MODE == 'informer' and resource_version is not None:
+            cluster.restored[plural] = (resource_version, items)
+        cache.update(records)
+        for rollup in cluster.rollups[plural]:
+            # The latency trackers were restored as of when the state was saved;
+            # updating them now would take the objects to have been seen now
+            if not isinstance(rollup, LatencyTracker):
+                rollup.update(cache.records())
+        parts[plural] = cache.families
+        cluster.loaded.add(plural)
+        cluster.metrics.objects.labels(kind=plural).set(len(records))
+        cluster.metrics.kind_stale.labels(kind=plural).set(1)
+    cluster.snapshot.publish(parts)
+    return len(parts)
+
+
+def warm_start():
+    """Restore every cluster found in STATE_FILE and render /metrics from it."""
+    state = load_state(STATE_FILE, STATE_MAX_AGE)
+    if state is None:
+        return
+    age = time.time() - state['saved_at']
+    for cluster in clusters:
+        saved = state['clusters'].get(cluster.name)
+        if saved is None:
+            continue
+        try:
+            restored = restore_cluster(cluster, saved)
+        except Exception as e:
+            print(f"Error restoring saved state{cluster_suffix(cluster)}: {e}")
+            continue
+        print(f"Restored {restored} kinds{cluster_suffix(cluster)} from state saved {age:.0f}s ago")
+    render()
+
+
+_render_lock = threading.Lock()
+_render_wanted = threading.Event()
+
+
+def render():
+    """Re-render /metrics from the current snapshot and exporter metrics.
+
+    With several clusters each loop asks for renders; a call while another
+    render is running makes that one render again once it is done instead
+    of rendering alongside it.
+    """
+    _render_wanted.set()
+    while _render_wanted.is_set():
+        if not _render_lock.acquire(blocking=False):
+            return
+        try:
+            _render_wanted.clear()
+            started = time.monotonic()
+            exposition.render()
+            render_duration.observe(time.monotonic() - started)
+        finally:
+            _render_lock.release()
+
+
+def timed_out(cluster, plural, e):
+    print(f"Timed out collecting {plural} data{cluster_suffix(cluster)}, serving last good data")
+    cluster.metrics.errors.labels(kind=plural, exception=type(e).__name__).inc()
+    cluster.metrics.kind_stale.labels(kind=plural).set(1)
+
+
+def poll_loop(cluster):
+    """Refresh each kind of a cluster on its own schedule (see KindSchedule).
+
+    A kind that is due while its last refresh is still running waits for it
+    and is counted as an overrun, so refreshes of one kind never overlap.
+    /metrics is re-rendered once the refreshes that finished have nothing
+    else running alongside them, or at the latest every POLL_INTERVAL.
+    """
+    metrics = cluster.metrics
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(KINDS),
+                                                 thread_name_prefix=f'collect-{cluster.name}'.rstrip('-'))
+    schedules = {kind.plural: KindSchedule(kind_interval(kind)) for kind in KINDS}
+    running = {}
+    overrun = set()
+    expired = set()
+    pending_render = False
+    last_render = time.monotonic()
+    while True:
+        now = time.monotonic()
+        for kind in KINDS:
+            plural = kind.plural
+            if schedules[plural].due > now:
+                continue
+            if plural in running:
+                started = running[plural][1]
+                if plural not in overrun and now >= started + schedules[plural].current:
+                    metrics.cycle_overruns.labels(kind=plural).inc()
+                    overrun.add(plural)
+                continue
+            running[plural] = (pool.submit(refresh, cluster, kind), now)
+            overrun.discard(plural)
+
+        # Sleep until a refresh finishes, one runs past its deadline or the next is due
+        wake = min([schedule.due for plural, schedule in schedules.items() if plural not in running] +
+                   [started + kind_timeout(plural) for plural, (_, started) in running.items()
+                    if plural not in expired] +
+                   [last_render + POLL_INTERVAL])
+        timeout = max(0, wake - time.monotonic())
+        if running:
+            concurrent.futures.wait([future for future, _ in running.values()], timeout=timeout,
+                                    return_when=concurrent.futures.FIRST_COMPLETED)
+        else:
+            time.sleep(timeout)
+
+        now = time.monotonic()
+        for plural, (future, started) in list(running.items()):
+            schedule = schedules[plural]
+            if future.done():
+                del running[plural]
+                expired.discard(plural)
+                try:
+                    schedule.succeeded(future.result(), now)
+                except Exception as e:
+                    schedule.failed(e, now)
+                metrics.refresh_interval.labels(kind=plural).set(schedule.due - now)
+                pending_render = True
+            elif plural not in expired and now >= started + kind_timeout(plural):
+                # The refresh keeps running and publishes if it finishes later
+                timed_out(cluster, plural, concurrent.futures.TimeoutError())
+                expired.add(plural)
+
+        if (pending_render and len(running) == len(expired)) or now >= last_render + POLL_INTERVAL:
+            render()
+            pending_render = False
+            last_render = time.monotonic()
+
+
+def informer_loop(cluster):
+    """Keep every kind of a cluster current from watches and publish the changes in bursts.
+
+    Each kind has one informer watching the whole cluster, since a watch per
+    namespace would take a thread and a connection for every namespace of a
+    shard. With NDK_SHARDS it stores only the objects in this shard's
+    namespaces, but still receives and decodes every object of the kind.
+    """
+    metrics = cluster.metrics
+    changed = threading.Event()
+    informers = cluster.informers
+    for kind in KINDS:
+        # The store keeps only the projected records, not the full objects
+        informer = Informer(cluster.api, kind.group, kind.version, kind.plural, metrics, PAGE_SIZE,
+                            project=kind.fields.project, decode=decode, metadata_only=kind.fields.metadata_only,
+                            on_change=changed.set, keep=cluster.keep.allows if cluster.keep else None,
+                            list_timeout=kind_timeout(kind.plural))
+        restored = cluster.restored.pop(kind.plural, None)
+        if restored is not None:
+            # Serve the saved store and resume its watch instead of relisting
+            informer.restore(*restored)
+        informer.start()
+        informers[kind.plural] = informer
+    # Whatever no informer took (a kind no longer exported) is never needed
+    cluster.restored.clear()
 
-    except Exception as e:
-        print(f"Error in appprotectionplan_collect: {e}")
+    while True:
+        # Wait for the first change, then give the rest of a burst a moment to
+        # land so a flurry of events turns into one metrics update.
+        changed.wait(POLL_INTERVAL)
+        time.sleep(1)
+        changed.clear()
+        parts = {}
+        for kind in KINDS:
+            plural = kind.plural
+            informer = informers[plural]
+            # Restored stores, and stores whose list or watch failed, stay
+            # stale until their watch resumes or they relist
+            metrics.kind_stale.labels(kind=plural).set(0 if informer.current else 1)
+            dirty = informer.take_dirty()
+            if not informer.synced or not dirty:
+                if informer.current:
+                    checked(cluster, plural)
+                continue
+            cache = cluster.caches[plural]
+            started = time.monotonic()
+            try:
+                items = informer.items()
+                if cache.update(items):
+                    records = cache.records()
+                    for rollup in cluster.rollups[plural]:
+                        rollup.update(records)
+                    parts[plural] = cache.families
+                metrics.objects.labels(kind=plural).set(len(items))
+            except Exception as e:
+                print(f"Error collecting {plural} data{cluster_suffix(cluster)}: {e}")
+                metrics.errors.labels(kind=plural, exception=type(e).__name__).inc()
+            metrics.refresh_duration.labels(kind=plural, phase='process').observe(time.monotonic() - started)
+        if parts:
+            cluster.snapshot.publish(parts)
+            state_changed()
+        if cluster.shard is not None:
+            metrics.shard_namespaces.set(cluster.shard.owned())
+        render()
+
+
+def create_clusters():
+    """The cluster the exporter runs in, or one Cluster per NDK_KUBECONFIGS entry.
+
+    A kubeconfig that cannot be loaded is logged and left out rather than
+    keeping the other clusters from being exported.
+    """
+    if not KUBECONFIGS:
+        return [Cluster('', create_api())]
+    created = []
+    for name, path in parse_kubeconfigs(KUBECONFIGS):
+        try:
+            api = create_api(path)
+        except Exception as e:
+            print(f"Error loading kubeconfig {path} for cluster {name}, not exporting it: {e}")
+            continue
+        created.append(Cluster(name, api, CollectorRegistry()))
+    if not created:
+        raise SystemExit("None of the clusters in NDK_KUBECONFIGS could be loaded")
+    return created
 
 
 if __name__ == '__main__':
-    start_http_server(8000)
-    while True:
-        application_collect()
-        application_snapshot_collect()
-        application_restore_collect()
-        remote_collect()
-        replicationtarget_collect()
-        application_snapshot_replication_collect()
-        jobscheduler_collect()
-        protectionplan_collect()
-        app_protectionplan_collect()
-        time.sleep(30)
\ No newline at end of file
+    clusters.extend(create_clusters())
+    start_exposition_server(8000, exposition, on_scrape=lambda code: scrapes.labels(code=str(code)).inc())
+    if STATE_FILE:
+        warm_start()
+        state_writer = StateWriter(STATE_FILE, STATE_INTERVAL, gather_state)
+        state_writer.start()
+    loop = informer_loop if MODE == 'informer' else poll_loop
+    for cluster in clusters[1:]:
+        threading.Thread(target=loop, args=(cluster,), name=f'cluster-{cluster.name}', daemon=True).start()
+    loop(clusters[0])
@@ -0,0 +1,91 @@
+import datetime
+import sys
+from collections import namedtuple
+
+Condition = namedtuple('Condition', ['type', 'status', 'last_transition_time'])
+
+
+def intern(value):
+    """One shared copy of a string that many objects repeat, like a namespace."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def timestamp(value):
+    """Unix time in whole seconds of an RFC 3339 timestamp, or None."""
+    try:
+        return int(datetime.datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+    except (AttributeError, ValueError):
+        return None
+
+
+def conditions(value):
+    """Reduce status.conditions to (type, status, lastTransitionTime) tuples,
+    with the time in Unix seconds."""
+    return tuple(
+        Condition(intern(c.get('type', '')), intern(c.get('status', 'unknown')),
+                  timestamp(c.get('lastTransitionTime')))
+        for c in value
+    )
+
+
+def _getter(path, default, convert):
+    keys = tuple(path.split('.'))
+
+    def get(obj):
+        for key in keys:
+            if not isinstance(obj, dict):
+                return default
+            obj = obj.get(key)
+            if obj is None:
+                return default
+        return convert(obj) if convert is not None else obj
+
+    return get
+
+
+class Fields:
+    """The fields a collector reads from each object.
+
+    `fields` maps a record attribute to a dotted path into the object, or to a
+    (path, default) or (path, default, convert) tuple. project() pulls just
+    those values out of a decoded object into a compact namedtuple so the rest
+    of the object (managedFields, annotations, the bulk of spec and status) can
+    be released as soon as its page has been read. Every record also carries
+    the object's resourceVersion, which is how unchanged objects are spotted.
+
+    A kind whose fields all live under metadata is listed and watched as
+    PartialObjectMetadata, so the apiserver never sends its spec or status.
+    Adding a spec or status field here switches it back to full objects.
+
+    Records are tuples, so they cost no more than their values. Converters
+    run once per object as it is projected: `timestamp` turns times into Unix
+    seconds so nothing downstream parses them again, and `intern` shares one
+    copy of strings that thousands of objects repeat, like namespaces.
+    identity() reads just the namespace, name and resourceVersion of an
+    object, so unchanged objects need not be projected at all (see
+    SeriesCache.update).
+    """
+
+    def __init__(self, name, fields):
+        fields = dict(fields, resource_version='metadata.resourceVersion')
+        self.paths = {}
+        getters = []
+        for attr, spec in fields.items():
+            if isinstance(spec, str):
+                spec = (spec,)
+            path, default, convert = (tuple(spec) + (None, None))[:3]
+            self.paths[attr] = path
+            getters.append(_getter(path, default, convert))
+        self.record = namedtuple(name, list(fields))
+        self._getters = tuple(getters)
+        names = list(fields)
+        self._identity = tuple(getters[names.index(attr)] for attr in ('namespace', 'name', 'resource_version'))
+        self.metadata_only = all(path.startswith('metadata.') for path in self.paths.values())
+
+    def project(self, obj):
+        return self.record._make([get(obj) for get in self._getters])
+
+    def identity(self, obj):
+        """(namespace, name, resourceVersion) of an object, as its record would have them."""
+        namespace, name, resource_version = self._identity
+        return namespace(obj), name(obj), resource_version(obj)
@@ -0,0 +1,189 @@
+import collections
+import threading
+
+from rollups import Table
+from snapshot import Metric
+
+application_replication_lag = Metric(
+    'ndk_application_replication_lag_seconds',
+    'How far the newest replicated ApplicationSnapshot of an application trails its newest ready one, in seconds',
+    ['namespace', 'application']
+)
+application_last_replicated_snapshot_timestamp = Metric(
+    'ndk_application_last_replicated_snapshot_timestamp_seconds',
+    'Creation time of the newest ApplicationSnapshot of an application with an available replication, '
+    'as Unix timestamp in seconds',
+    ['namespace', 'application']
+)
+application_replications = Metric(
+    'ndk_application_replications',
+    'ApplicationSnapshotReplications of an application by whether they are available',
+    ['namespace', 'application', 'available']
+)
+application_unhealthy_replications = Metric(
+    'ndk_application_unhealthy_replications',
+    'ApplicationSnapshotReplications of an application whose ReplicationTarget or Remote is not ready',
+    ['namespace', 'application', 'remote', 'reason']
+)
+dangling_references = Metric(
+    'ndk_dangling_references',
+    'References from NDK resources to resources that do not exist, by referring and referenced kind',
+    ['namespace', 'kind', 'reference']
+)
+
+METRICS = (
+    application_replication_lag,
+    application_last_replicated_snapshot_timestamp,
+    application_replications,
+    application_unhealthy_replications,
+    dangling_references,
+)
+
+
+def healthy(conditions):
+    """Whether an object's Available (or Ready) condition is True.
+
+    Objects with neither condition fall back to their first condition, which
+    is what the info series report as their status.
+    """
+    for condition in conditions:
+        if condition.type in ('Available', 'Ready'):
+            return condition.status == 'True'
+    return bool(conditions) and conditions[0].status == 'True'
+
+
+# What the index keeps of each record, per kind
+TABLES = {
+    'applications': lambda rec: ((rec.namespace, rec.name), None),
+    'applicationsnapshots': lambda rec: ((rec.namespace, rec.name), (
+        rec.application, rec.ready_to_use is True, rec.creation_time)),
+    'applicationsnapshotreplications': lambda rec: ((rec.namespace, rec.name), (
+        rec.snapshot_name, rec.replication_target_name, healthy(rec.conditions))),
+    'replicationtargets': lambda rec: ((rec.namespace, rec.name), (rec.remote_name, healthy(rec.conditions))),
+    'remotes': lambda rec: (rec.name, healthy(rec.conditions)),
+    'protectionplans': lambda rec: ((rec.namespace, rec.name), None),
+    'appprotectionplans': lambda rec: ((rec.namespace, rec.name), (rec.application, tuple(rec.protection_plans))),
+}
+
+
+class RelationshipIndex:
+    """Follows the references between NDK resources.
+
+    Application <- ApplicationSnapshot <- ApplicationSnapshotReplication ->
+    ReplicationTarget -> Remote, and AppProtectionPlan -> Application and
+    ProtectionPlans. Each kind's table is replaced only when that kind
+    changes (through its Table), and the joins are redone at the next
+    collection after any change.
+
+    Namespaced references point into the referring object's namespace;
+    Remotes are cluster-scoped. References into a kind are only reported as
+    dangling once that kind has been listed.
+    """
+
+    def __init__(self, dropped=None):
+        self.dropped = dropped
+        self._tables = {plural: None for plural in TABLES}
+        self._families = None
+        self._lock = threading.Lock()
+
+    def table(self, plural):
+        return Table(self, plural)
+
+    def update(self, plural, records):
+        reduce = TABLES[plural]
+        table = dict(reduce(rec) for rec in records)
+        with self._lock:
+            self._tables = dict(self._tables, **{plural: table})
+            self._families = None
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        families = self._families
+        if families is None:
+            tables = self._tables
+            samples = {metric: [] for metric in METRICS}
+            for metric, sample in self.samples(tables):
+                samples[metric].append(sample)
+            families = [metric.family(samples[metric], self.dropped) for metric in METRICS]
+            with self._lock:
+                if self._tables is tables:
+                    self._families = families
+        return families
+
+    def samples(self, tables):
+        loaded = {plural for plural, table in tables.items() if table is not None}
+        tables = {plural: table or {} for plural, table in tables.items()}
+        applications = tables['applications']
+        snapshots = tables['applicationsnapshots']
+        targets = tables['replicationtargets']
+        remotes = tables['remotes']
+        plans = tables['protectionplans']
+        dangling = collections.Counter()
+
+        def dangle(namespace, kind, reference):
+            if reference in loaded:
+                dangling[(namespace, kind, reference)] += 1
+
+        last_ready = {}
+        for (namespace, _), (application, ready, created) in snapshots.items():
+            if (namespace, application) not in applications:
+                dangle(namespace, 'applicationsnapshots', 'applications')
+            if ready and created is not None:
+                key = (namespace, application)
+                if created > last_ready.get(key, 0):
+                    last_ready[key] = created
+
+        last_replicated = {}
+        replications = collections.Counter()
+        unhealthy = collections.Counter()
+        for (namespace, _), (snapshot_name, target_name, available) in \
+                tables['applicationsnapshotreplications'].items():
+            snapshot = snapshots.get((namespace, snapshot_name))
+            if snapshot is None:
+                dangle(namespace, 'applicationsnapshotreplications', 'applicationsnapshots')
+                application = 'unknown'
+            else:
+                application, ready, created = snapshot
+                if available and created is not None:
+                    key = (namespace, application)
+                    if created > last_replicated.get(key, 0):
+                        last_replicated[key] = created
+            replications[(namespace, application, str(available).lower())] += 1
+
+            target = targets.get((namespace, target_name))
+            if target is None:
+                dangle(namespace, 'applicationsnapshotreplications', 'replicationtargets')
+                continue
+            remote_name, target_ready = target
+            if not target_ready:
+                unhealthy[(namespace, application, remote_name, 'target_not_ready')] += 1
+            elif remotes.get(remote_name) is False:
+                unhealthy[(namespace, application, remote_name, 'remote_not_ready')] += 1
+
+        for (namespace, _), (remote_name, _) in targets.items():
+            if remote_name not in remotes:
+                dangle(namespace, 'replicationtargets', 'remotes')
+
+        for (namespace, _), (application, plan_names) in tables['appprotectionplans'].items():
+            if application and (namespace, application) not in applications:
+                dangle(namespace, 'appprotectionplans', 'applications')
+            for plan_name in plan_names:
+                if (namespace, plan_name) not in plans:
+                    dangle(namespace, 'appprotectionplans', 'protectionplans')
+
+        for (namespace, application), replicated in last_replicated.items():
+            labels = {'namespace': namespace, 'application': application}
+            yield application_last_replicated_snapshot_timestamp.sample(replicated, **labels)
+            ready = last_ready.get((namespace, application))
+            if ready is not None:
+                yield application_replication_lag.sample(max(0, ready - replicated), **labels)
+        for (namespace, application, available), count in replications.items():
+            yield application_replications.sample(
+                count, namespace=namespace, application=application, available=available)
+        for (namespace, application, remote, reason), count in unhealthy.items():
+            yield application_unhealthy_replications.sample(
+                count, namespace=namespace, application=application, remote=remote, reason=reason)
+        for (namespace, kind, reference), count in dangling.items():
+            yield dangling_references.sample(count, namespace=namespace, kind=kind, reference=reference)
@@ -0,0 +1,134 @@
+import bisect
+import time
+
+from snapshot import Metric
+
+application_snapshots = Metric(
+    'ndk_application_snapshots',
+    'Number of ApplicationSnapshots of an application by readiness',
+    ['namespace', 'application', 'ready_to_use']
+)
+application_last_ready_snapshot_timestamp = Metric(
+    'ndk_application_last_ready_snapshot_timestamp_seconds',
+    'Creation time of the newest ready ApplicationSnapshot of an application as Unix timestamp in seconds',
+    ['namespace', 'application']
+)
+application_last_ready_snapshot_age = Metric(
+    'ndk_application_last_ready_snapshot_age_seconds',
+    'Seconds since the newest ready ApplicationSnapshot of an application was created (its recovery point age)',
+    ['namespace', 'application']
+)
+application_oldest_snapshot_timestamp = Metric(
+    'ndk_application_oldest_snapshot_timestamp_seconds',
+    'Creation time of the oldest ApplicationSnapshot of an application as Unix timestamp in seconds',
+    ['namespace', 'application']
+)
+application_next_snapshot_expiration_timestamp = Metric(
+    'ndk_application_next_snapshot_expiration_timestamp_seconds',
+    'Soonest upcoming expiration among the ApplicationSnapshots of an application as Unix timestamp in seconds',
+    ['namespace', 'application']
+)
+application_expired_snapshots = Metric(
+    'ndk_application_expired_snapshots',
+    'Number of ApplicationSnapshots of an application past their expiration time that still exist',
+    ['namespace', 'application']
+)
+
+METRICS = (
+    application_snapshots,
+    application_last_ready_snapshot_timestamp,
+    application_last_ready_snapshot_age,
+    application_oldest_snapshot_timestamp,
+    application_next_snapshot_expiration_timestamp,
+    application_expired_snapshots,
+)
+
+
+class Table:
+    """Feeds the records of one kind into a collector that spans several kinds.
+
+    Used as a Kind rollup: update(records) is passed on as
+    collector.update(plural, records).
+    """
+
+    def __init__(self, collector, plural):
+        self.collector = collector
+        self.plural = plural
+
+    def update(self, records):
+        self.collector.update(self.plural, records)
+
+
+class ApplicationSnapshots:
+    """What the rollup keeps about the snapshots of one application."""
+
+    __slots__ = ('ready', 'not_ready', 'last_ready', 'oldest', 'expirations')
+
+    def __init__(self):
+        self.ready = 0
+        self.not_ready = 0
+        self.last_ready = None
+        self.oldest = None
+        self.expirations = []
+
+    def add(self, ready, created, expires):
+        if ready:
+            self.ready += 1
+            if created is not None and (self.last_ready is None or created > self.last_ready):
+                self.last_ready = created
+        else:
+            self.not_ready += 1
+        if created is not None and (self.oldest is None or created < self.oldest):
+            self.oldest = created
+        if expires is not None:
+            self.expirations.append(expires)
+
+
+class SnapshotRollup:
+    """Per-application snapshot health, so dashboards need not join every snapshot series.
+
+    update() indexes the current ApplicationSnapshot records by namespace and
+    application, and is called whenever the snapshots change. The index holds
+    timestamps only; ages and the expired counts depend on the time and are
+    worked out when the registry is collected.
+    """
+
+    def __init__(self, dropped=None):
+        self.dropped = dropped
+        self._index = {}
+
+    def update(self, records):
+        index = {}
+        for rec in records:
+            key = (rec.namespace, rec.application)
+            app = index.get(key)
+            if app is None:
+                app = index[key] = ApplicationSnapshots()
+            app.add(rec.ready_to_use is True, rec.creation_time, rec.expiration_time)
+        for app in index.values():
+            app.expirations.sort()
+        self._index = index
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        samples = {metric: [] for metric in METRICS}
+        for metric, sample in self.samples(time.time()):
+            samples[metric].append(sample)
+        return [metric.family(samples[metric], self.dropped) for metric in METRICS]
+
+    def samples(self, now):
+        for (namespace, application), app in self._index.items():
+            labels = {'namespace': namespace, 'application': application}
+            yield application_snapshots.sample(app.ready, ready_to_use='true', **labels)
+            yield application_snapshots.sample(app.not_ready, ready_to_use='false', **labels)
+            if app.last_ready is not None:
+                yield application_last_ready_snapshot_timestamp.sample(app.last_ready, **labels)
+                yield application_last_ready_snapshot_age.sample(max(0, now - app.last_ready), **labels)
+            if app.oldest is not None:
+                yield application_oldest_snapshot_timestamp.sample(app.oldest, **labels)
+            expired = bisect.bisect_right(app.expirations, now)
+            if expired < len(app.expirations):
+                yield application_next_snapshot_expiration_timestamp.sample(app.expirations[expired], **labels)
+            yield application_expired_snapshots.sample(expired, **labels)
@@ -0,0 +1,63 @@
+import random
+
+from kubernetes.client.rest import ApiException
+
+# Each refresh is pushed up to this fraction earlier or later so kinds, and
+# exporter replicas, drift apart instead of hitting the apiserver in step
+JITTER = 0.1
+# A refresh that found changes halves the interval, down to this fraction of
+# the kind's own interval; refreshes that find nothing double it back
+SPEEDUP_FLOOR = 0.5
+# Longest wait after repeated failures
+MAX_BACKOFF = 600
+
+
+def retry_after(error):
+    """Seconds from the Retry-After header of a 429/503 ApiException, if any."""
+    if not isinstance(error, ApiException) or error.status not in (429, 503):
+        return None
+    value = (error.headers or {}).get('Retry-After')
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class KindSchedule:
+    """Decides when one kind is refreshed next.
+
+    A kind is refreshed every `interval` seconds (with jitter) while nothing
+    happens. Each refresh that finds changes halves the wait, down to
+    SPEEDUP_FLOOR of the interval, and each one that finds none doubles it
+    back; the first refresh fills the cache and does not count as a change.
+    A failed refresh backs off exponentially from the interval up to
+    MAX_BACKOFF, waiting at least as long as a 429's Retry-After, and the
+    next success resets it.
+    """
+
+    def __init__(self, interval, rand=random.random):
+        self.interval = interval
+        self.current = interval
+        self.failures = 0
+        self.synced = False
+        self.due = 0.0
+        self._rand = rand
+
+    def succeeded(self, changed, now):
+        self.failures = 0
+        if changed and self.synced:
+            self.current = max(self.interval * SPEEDUP_FLOOR, self.current / 2)
+        else:
+            self.current = min(self.interval, self.current * 2)
+        self.synced = True
+        self.due = now + self._jitter(self.current)
+
+    def failed(self, error, now):
+        self.failures += 1
+        backoff = min(MAX_BACKOFF, self.interval * 2 ** self.failures)
+        # Equal jitter: somewhere between half and all of the backoff
+        delay = backoff / 2 + self._rand() * backoff / 2
+        self.due = now + max(delay, retry_after(error) or 0)
+
+    def _jitter(self, seconds):
+        return seconds * (1 + JITTER * (2 * self._rand() - 1))
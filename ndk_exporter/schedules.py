@@ -0,0 +1,384 @@
+import datetime
+import functools
+import threading
+import time
+import zoneinfo
+
+from rollups import Table
+from snapshot import Metric
+
+jobscheduler_next_run = Metric(
+    'ndk_jobscheduler_next_run_timestamp_seconds',
+    'When a JobScheduler fires next according to its spec, as Unix timestamp in seconds',
+    ['jobscheduler_name', 'namespace']
+)
+jobscheduler_previous_run = Metric(
+    'ndk_jobscheduler_previous_run_timestamp_seconds',
+    'When a JobScheduler last fired according to its spec, as Unix timestamp in seconds',
+    ['jobscheduler_name', 'namespace']
+)
+application_expected_snapshot_missing = Metric(
+    'ndk_application_expected_snapshot_missing',
+    'Whether no ApplicationSnapshot of an application was created for the last run of the JobScheduler '
+    'of one of its ProtectionPlans (1) or one was (0)',
+    ['namespace', 'application', 'protectionplan']
+)
+
+METRICS = (
+    jobscheduler_next_run,
+    jobscheduler_previous_run,
+    application_expected_snapshot_missing,
+)
+
+# A snapshot created this long before a run still counts for it, for clock skew
+# between the scheduler and the apiserver
+EARLY = 60
+# How far ahead a calendar schedule is searched for its next run; a February
+# 29th only comes around every eight years at worst
+SEARCH_DAYS = 8 * 366
+
+MONTHS = {name: n for n, name in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], 1)}
+WEEKDAYS = {name: n for n, name in enumerate(['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'])}
+MACROS = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+
+
+class Schedule:
+    """When a JobScheduler fires.
+
+    next_after(t) is the first run after t and previous_at(t) the last one at
+    or before t, both as Unix time in seconds or None. window(t) returns both
+    and keeps the last two answers, which stay valid until the next run, so
+    asking again each collection costs a comparison.
+    """
+
+    _windows = ()
+
+    def window(self, t):
+        for previous, following in self._windows:
+            if (previous is None or previous <= t) and (following is None or t < following):
+                return previous, following
+        window = (self.previous_at(t), self.next_after(t))
+        self._windows = (window,) + self._windows[:1]
+        return window
+
+
+class Interval(Schedule):
+    """Every `seconds`, counted from `anchor`."""
+
+    def __init__(self, seconds, anchor):
+        self.seconds = seconds
+        self.anchor = anchor
+
+    def next_after(self, t):
+        if t < self.anchor:
+            return self.anchor
+        return self.anchor + ((t - self.anchor) // self.seconds + 1) * self.seconds
+
+    def previous_at(self, t):
+        if t < self.anchor:
+            return None
+        return self.anchor + (t - self.anchor) // self.seconds * self.seconds
+
+
+class Once(Schedule):
+    """A single run at `at`."""
+
+    def __init__(self, at):
+        self.at = at
+
+    def next_after(self, t):
+        return self.at if t < self.at else None
+
+    def previous_at(self, t):
+        return self.at if self.at <= t else None
+
+
+class Calendar(Schedule):
+    """The minutes matching a cron expression, in a time zone.
+
+    As in cron, a day matches if both its day of month and weekday match, or
+    either one when both fields are restricted.
+    """
+
+    def __init__(self, minutes, hours, days, months, weekdays, tz, any_day, any_weekday):
+        self.minutes = minutes
+        self.hours = hours
+        self.days = frozenset(days)
+        self.months = frozenset(months)
+        self.weekdays = frozenset(weekdays)
+        self.tz = tz
+        self.any_day = any_day
+        self.any_weekday = any_weekday
+
+    def _matches(self, day):
+        if day.month not in self.months:
+            return False
+        weekday = day.isoweekday() % 7 in self.weekdays
+        if self.any_day:
+            return weekday
+        if self.any_weekday:
+            return day.day in self.days
+        return weekday or day.day in self.days
+
+    def _at(self, day, hour, minute):
+        return datetime.datetime(day.year, day.month, day.day, hour, minute, tzinfo=self.tz).timestamp()
+
+    def next_after(self, t):
+        start = datetime.datetime.fromtimestamp(t, self.tz).date()
+        for offset in range(SEARCH_DAYS):
+            day = start + datetime.timedelta(days=offset)
+            if not self._matches(day):
+                continue
+            for hour in self.hours:
+                if self._at(day, hour, self.minutes[-1]) <= t:
+                    continue
+                for minute in self.minutes:
+                    at = self._at(day, hour, minute)
+                    if at > t:
+                        return at
+        return None
+
+    def previous_at(self, t):
+        start = datetime.datetime.fromtimestamp(t, self.tz).date()
+        for offset in range(SEARCH_DAYS):
+            day = start - datetime.timedelta(days=offset)
+            if not self._matches(day):
+                continue
+            for hour in reversed(self.hours):
+                if self._at(day, hour, self.minutes[0]) > t:
+                    continue
+                for minute in reversed(self.minutes):
+                    at = self._at(day, hour, minute)
+                    if at <= t:
+                        return at
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def zone(name):
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"unknown time zone {name!r}") from None
+
+
+def _value(text, names):
+    text = text.lower()
+    if text in names:
+        return names[text]
+    return int(text)
+
+
+def _field(text, low, high, names=None):
+    """The sorted values one cron field matches."""
+    values = set()
+    for part in text.split(','):
+        part, slash, step = part.partition('/')
+        step = int(step) if slash else 1
+        if part in ('*', '?'):
+            start, end = low, high
+        elif '-' in part:
+            start, end = (_value(bound, names or {}) for bound in part.split('-', 1))
+        else:
+            start = _value(part, names or {})
+            end = high if slash else start
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f"{text!r} is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return tuple(sorted(values))
+
+
+@functools.lru_cache(maxsize=4096)
+def calendar(expression, timezone):
+    """The Calendar of a five field cron expression, shared by every scheduler using it.
+
+    Accepts lists, ranges, steps, month and weekday names, the @daily style
+    macros and a CRON_TZ= or TZ= prefix, which overrides `timezone`.
+    """
+    expression = expression.strip()
+    if expression.startswith(('CRON_TZ=', 'TZ=')):
+        prefix, _, expression = expression.partition(' ')
+        timezone = prefix.split('=', 1)[1]
+        expression = expression.strip()
+    expression = MACROS.get(expression.lower(), expression)
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError(f"cron expression {expression!r} does not have five fields")
+    minute, hour, day, month, weekday = fields
+    weekdays = {value % 7 for value in _field(weekday, 0, 7, WEEKDAYS)}
+    return Calendar(
+        _field(minute, 0, 59), _field(hour, 0, 23), _field(day, 1, 31), _field(month, 1, 12, MONTHS),
+        weekdays, zone(timezone), day in ('*', '?'), weekday in ('*', '?'),
+    )
+
+
+def _time(value):
+    hour, minute = str(value).split(':')[:2]
+    return int(hour), int(minute)
+
+
+def _weekday(value):
+    if isinstance(value, int):
+        return value % 7
+    return WEEKDAYS[str(value).strip().lower()[:3]]
+
+
+def _list(value):
+    if isinstance(value, str):
+        return [item for item in value.split(',') if item.strip()]
+    return list(value)
+
+
+def schedule(rec):
+    """The Schedule of a JobScheduler record, or None if its spec has none.
+
+    Raises ValueError for a spec that cannot be understood.
+    """
+    timezone = rec.timezone if rec.timezone not in (None, '', 'unknown') else 'UTC'
+    try:
+        if rec.interval is not None:
+            seconds = 60 * int(rec.interval.get('minutes', 0)) + 3600 * int(rec.interval.get('hours', 0))
+            if seconds <= 0:
+                raise ValueError(f"interval {rec.interval!r} is not positive")
+            anchor = rec.start_at or rec.created or 0
+            return Interval(seconds, anchor)
+        if rec.daily is not None:
+            hour, minute = _time(rec.daily['time'])
+            return calendar(f"{minute} {hour} * * *", timezone)
+        if rec.weekly is not None:
+            hour, minute = _time(rec.weekly['time'])
+            days = ','.join(str(_weekday(day)) for day in _list(rec.weekly['days']))
+            return calendar(f"{minute} {hour} * * {days}", timezone)
+        if rec.monthly is not None:
+            hour, minute = _time(rec.monthly['time'])
+            dates = ','.join(str(int(date)) for date in _list(rec.monthly['dates']))
+            return calendar(f"{minute} {hour} {dates} * *", timezone)
+        if rec.cron_schedule is not None:
+            return calendar(rec.cron_schedule, timezone)
+    except (AttributeError, KeyError, TypeError) as e:
+        raise ValueError(f"malformed schedule: {e!r}") from None
+    if rec.start_time is not None:
+        if rec.start_at is None:
+            raise ValueError(f"start time {rec.start_time!r} is not a timestamp")
+        return Once(rec.start_at)
+    return None
+
+
+def newest_snapshots(records):
+    newest = {}
+    for rec in records:
+        created = rec.created
+        key = (rec.namespace, rec.application)
+        if created is not None and created > newest.get(key, 0):
+            newest[key] = created
+    return newest
+
+
+# What the tracker keeps of each record, per kind; JobSchedulers are handled
+# separately so their parsed schedules can be reused
+TABLES = {
+    'protectionplans': lambda records: {(rec.namespace, rec.name): rec.schedule_name for rec in records},
+    'appprotectionplans': lambda records: {
+        (rec.namespace, rec.name): (rec.application, tuple(rec.protection_plans)) for rec in records},
+    'applicationsnapshots': newest_snapshots,
+}
+
+
+class ScheduleTracker:
+    """Works out when each JobScheduler should fire and whether its snapshots appeared.
+
+    A JobScheduler's spec is parsed into a Schedule only when its
+    resourceVersion changes, and calendar schedules are shared between
+    schedulers with the same expression and time zone, so each collection
+    only compares the time against cached next runs.
+
+    AppProtectionPlan -> ProtectionPlans -> JobScheduler (spec.scheduleName)
+    gives the schedules an application is snapshotted on. Once the previous
+    run of one is `grace` seconds old, an ApplicationSnapshot of the
+    application created since then is expected; the application is reported
+    missing one until it shows up.
+    """
+
+    def __init__(self, grace, dropped=None):
+        self.grace = grace
+        self.dropped = dropped
+        self._schedules = None
+        self._tables = {plural: None for plural in TABLES}
+        self._lock = threading.Lock()
+
+    def table(self, plural):
+        return Table(self, plural)
+
+    def update(self, plural, records):
+        if plural == 'jobschedulers':
+            self._update_schedules(records)
+            return
+        table = TABLES[plural](records)
+        with self._lock:
+            self._tables = dict(self._tables, **{plural: table})
+
+    def _update_schedules(self, records):
+        previous = self._schedules or {}
+        schedules = {}
+        for rec in records:
+            key = (rec.namespace, rec.name)
+            entry = previous.get(key)
+            if entry is None or entry[0] != rec.resource_version:
+                try:
+                    entry = (rec.resource_version, schedule(rec))
+                except ValueError as e:
+                    print(f"Ignoring schedule of JobScheduler {rec.namespace}/{rec.name}: {e}")
+                    entry = (rec.resource_version, None)
+            schedules[key] = entry
+        with self._lock:
+            self._schedules = schedules
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        samples = {metric: [] for metric in METRICS}
+        for metric, sample in self.samples(time.time()):
+            samples[metric].append(sample)
+        return [metric.family(samples[metric], self.dropped) for metric in METRICS]
+
+    def samples(self, now):
+        schedules = self._schedules or {}
+        tables = self._tables
+        for (namespace, name), (_, scheduled) in schedules.items():
+            if scheduled is None:
+                continue
+            previous, following = scheduled.window(now)
+            labels = {'jobscheduler_name': name, 'namespace': namespace}
+            if following is not None:
+                yield jobscheduler_next_run.sample(following, **labels)
+            if previous is not None:
+                yield jobscheduler_previous_run.sample(previous, **labels)
+
+        if self._schedules is None or any(table is None for table in tables.values()):
+            return
+        plans = tables['protectionplans']
+        newest = tables['applicationsnapshots']
+        for (namespace, _), (application, plan_names) in tables['appprotectionplans'].items():
+            if not application:
+                continue
+            created = newest.get((namespace, application))
+            for plan_name in plan_names:
+                entry = schedules.get((namespace, plans.get((namespace, plan_name))))
+                if entry is None or entry[1] is None:
+                    continue
+                expected, _ = entry[1].window(now - self.grace)
+                if expected is None:
+                    continue
+                missing = created is None or created < expected - EARLY
+                yield application_expected_snapshot_missing.sample(
+                    int(missing), namespace=namespace, application=application, protectionplan=plan_name)
@@ -0,0 +1,105 @@
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+
+
+class ClusterMetrics:
+    """Metrics about the exporter's work on one cluster, labelled by the plural of the NDK kind.
+
+    Registered on the cluster's registry, so in multi-cluster mode they get
+    its cluster label like every other series of the cluster.
+    """
+
+    def __init__(self, registry=REGISTRY):
+        self.refresh_duration = Histogram(
+            'ndk_exporter_refresh_duration_seconds',
+            'Time spent refreshing a kind, split into list (apiserver requests and decoding) and process '
+            '(projection and series)',
+            ['kind', 'phase'],
+            buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+            registry=registry
+        )
+
+        self.objects_processed = Counter(
+            'ndk_exporter_objects_processed',
+            'Objects read from LIST responses and WATCH events',
+            ['kind'],
+            registry=registry
+        )
+
+        self.objects = Gauge(
+            'ndk_exporter_objects',
+            'Objects of a kind seen in its last successful refresh',
+            ['kind'],
+            registry=registry
+        )
+
+        self.response_bytes = Counter(
+            'ndk_exporter_response_bytes',
+            'Bytes of LIST and WATCH response bodies received from the apiserver',
+            ['kind'],
+            registry=registry
+        )
+
+        self.errors = Counter(
+            'ndk_exporter_errors',
+            'Failed refreshes and watch streams by exception class',
+            ['kind', 'exception'],
+            registry=registry
+        )
+
+        self.last_success = Gauge(
+            'ndk_exporter_last_success_timestamp_seconds',
+            'Unix time of the last successful refresh of a kind',
+            ['kind'],
+            registry=registry
+        )
+
+        self.kind_stale = Gauge(
+            'ndk_exporter_kind_stale',
+            'Whether the metrics for a kind come from an older refresh because the last one failed or timed out '
+            '(1 for stale)',
+            ['kind'],
+            registry=registry
+        )
+
+        self.cycle_overruns = Counter(
+            'ndk_exporter_cycle_overruns',
+            'Times a kind was due for a refresh while its previous refresh was still running',
+            ['kind'],
+            registry=registry
+        )
+
+        self.refresh_interval = Gauge(
+            'ndk_exporter_refresh_interval_seconds',
+            'Seconds between the last refresh of a kind and the next one, after speed-up and backoff',
+            ['kind'],
+            registry=registry
+        )
+
+        self.shard_namespaces = Gauge(
+            'ndk_exporter_shard_namespaces',
+            'Namespaces this exporter replica exports when NDK_SHARDS replicas split them (in informer mode, '
+            'those seen with NDK objects)',
+            registry=registry
+        )
+
+        self.series_dropped = Gauge(
+            'ndk_exporter_series_dropped',
+            'Series left out of a metric family by its NDK_MAX_SERIES cap in the last refresh',
+            ['metric'],
+            registry=registry
+        )
+
+
+# Metrics about the exporter process as a whole
+
+render_duration = Histogram(
+    'ndk_exporter_render_duration_seconds',
+    'Time spent rendering and compressing the /metrics response after a refresh',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+)
+
+scrapes = Counter(
+    'ndk_exporter_scrapes',
+    'Scrapes of /metrics by HTTP status (304 when the scraper already had the current body)',
+    ['code']
+)
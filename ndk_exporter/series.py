@@ -0,0 +1,73 @@
+class SeriesCache:
+    """The samples every object of one kind produced, keyed by resourceVersion.
+
+    update() takes the current records of a kind. Objects whose resourceVersion
+    is unchanged keep the samples computed for them last time; only new and
+    modified objects go through the kind's series function, and objects that
+    have gone away simply drop out. When nothing changed the previously built
+    families are kept as they are, so a quiet refresh costs a dictionary lookup
+    per object instead of rebuilding every series.
+
+    The records themselves are kept too, for rollups over the whole kind (see
+    records()). Objects in namespaces that `keep` (a NamespaceFilter) does not
+    allow are left out entirely, without being projected.
+    `exports` are what the families are built from, each from the samples of
+    its `source` metric; by default the metrics themselves. Series they drop
+    to NDK_MAX_SERIES caps are counted on `dropped` (see Metric.family).
+
+    The first update() always reports a change, even for a kind with no
+    objects, so that whatever is built from the kind sees it at least once.
+    """
+
+    def __init__(self, metrics, series, exports=None, keep=None, dropped=None):
+        self.metrics = tuple(metrics)
+        self.series = series
+        self.exports = tuple(self.metrics if exports is None else exports)
+        self.keep = keep
+        self.dropped = dropped
+        self.families = [export.family(dropped=dropped) for export in self.exports]
+        self._entries = None
+
+    def update(self, records, fields=None):
+        """Bring the cache in line with `records`; return True if any series changed.
+
+        With `fields` (a projection.Fields), `records` are decoded objects and
+        only new and modified ones are projected; an unchanged object keeps
+        the record it was projected into last time.
+        """
+        first = self._entries is None
+        previous = {} if first else self._entries
+        entries = {}
+        changed = False
+        keep = self.keep
+        for rec in records:
+            if fields is None:
+                namespace, name, resource_version = rec.namespace, rec.name, rec.resource_version
+            else:
+                namespace, name, resource_version = fields.identity(rec)
+            if keep is not None and not keep.allows(namespace):
+                continue
+            key = (namespace, name)
+            entry = previous.get(key)
+            if entry is None or entry[0] != resource_version or resource_version is None:
+                if fields is not None:
+                    rec = fields.project(rec)
+                entry = (resource_version, tuple(self.series(rec)), rec)
+                changed = True
+            entries[key] = entry
+
+        # Without new or modified objects the key sets can only differ by deletions
+        if not changed and not first and len(entries) == len(previous):
+            return False
+
+        samples = {metric: [] for metric in self.metrics}
+        for _, produced, _ in entries.values():
+            for metric, sample in produced:
+                samples[metric].append(sample)
+        self.families = [export.family(samples[export.source], self.dropped) for export in self.exports]
+        self._entries = entries
+        return True
+
+    def records(self):
+        """The records of every object as of the last update()."""
+        return [entry[2] for entry in (self._entries or {}).values()]
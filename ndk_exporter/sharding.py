@@ -0,0 +1,107 @@
+import copy
+import hashlib
+import re
+import threading
+import time
+
+# How often a shard relists the cluster's namespaces to pick up new ones
+NAMESPACE_INTERVAL = 60
+
+
+def weight(shard, namespace):
+    return hashlib.blake2b(f'{shard}/{namespace}'.encode(), digest_size=8).digest()
+
+
+def shard_from_env(environ):
+    """The Shard of this replica from NDK_SHARDS and NDK_SHARD, or None when not sharded.
+
+    Without NDK_SHARD the index is the ordinal at the end of the pod's
+    hostname, which is how StatefulSet pods are named (ndk-exporter-2).
+    """
+    count = int(environ.get('NDK_SHARDS', '1'))
+    if count <= 1:
+        return None
+    index = environ.get('NDK_SHARD')
+    if not index:
+        match = re.search(r'-(\d+)$', environ.get('HOSTNAME', ''))
+        if match is None:
+            raise ValueError('NDK_SHARDS is set but neither NDK_SHARD nor a StatefulSet hostname gives the shard')
+        index = match.group(1)
+    index = int(index)
+    if not 0 <= index < count:
+        raise ValueError(f'shard {index} is not between 0 and NDK_SHARDS - 1 ({count - 1})')
+    return Shard(index, count)
+
+
+class Shard:
+    """This replica's share of the namespaces when NDK_SHARDS replicas split them.
+
+    Each namespace goes to the shard with the highest hash of (shard,
+    namespace) (rendezvous hashing). Every replica works out the same
+    assignment on its own, and going from N to N+1 replicas only moves the
+    namespaces the new shard wins, about 1/(N+1) of them; removing a replica
+    only moves the namespaces it had. Cluster-scoped objects belong to shard 0.
+    """
+
+    def __init__(self, index, count):
+        self.index = index
+        self.count = count
+        self.primary = index == 0
+        self._owners = {}
+        self._namespaces = None
+        self._listed = 0.0
+        self._lock = threading.Lock()
+
+    def owner(self, namespace):
+        owner = self._owners.get(namespace)
+        if owner is None:
+            owner = self._owners[namespace] = max(range(self.count), key=lambda shard: weight(shard, namespace))
+        return owner
+
+    def owns(self, namespace):
+        return self.owner(namespace) == self.index
+
+    def owned(self):
+        """How many of the namespaces asked about so far this shard owns."""
+        return sum(1 for owner in list(self._owners.values()) if owner == self.index)
+
+    def namespaces(self, list_namespaces, keep=None):
+        """The sorted namespaces of this shard, relisted at most every NAMESPACE_INTERVAL.
+
+        `list_namespaces` returns every namespace in the cluster and `keep`,
+        if given, drops namespaces that are not exported at all. If a relist
+        fails the previous list is kept.
+        """
+        with self._lock:
+            if self._namespaces is None or time.monotonic() >= self._listed + NAMESPACE_INTERVAL:
+                try:
+                    names = list_namespaces()
+                except Exception as e:
+                    if self._namespaces is None:
+                        raise
+                    print(f"Error listing namespaces, keeping the last list: {e}")
+                else:
+                    self._namespaces = sorted(name for name in names
+                                              if self.owns(name) and (keep is None or keep(name)))
+                self._listed = time.monotonic()
+            return self._namespaces
+
+
+class ShardLabel:
+    """A registry whose samples all carry this replica's `shard` label.
+
+    Shards export disjoint namespaces, so Prometheus can sum or join their
+    series directly. The label tells the replicas' own series apart and
+    shows which shard a namespace is on.
+    """
+
+    def __init__(self, registry, shard):
+        self.registry = registry
+        self.label = str(shard.index)
+
+    def collect(self):
+        for family in self.registry.collect():
+            family = copy.copy(family)
+            family.samples = [sample._replace(labels=dict(sample.labels, shard=self.label))
+                              for sample in family.samples]
+            yield family
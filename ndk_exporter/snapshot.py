@@ -0,0 +1,88 @@
+import threading
+
+from prometheus_client.metrics_core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.samples import Sample
+
+
+class Metric:
+    """Name, help text and label names of a gauge that is rebuilt on every refresh.
+
+    Unlike a prometheus_client Gauge there is no live state here: collectors
+    produce immutable samples, and a refresh wraps the current samples in a
+    fresh family before it is published. With `max_series` set a family keeps
+    only that many samples (see family()). A `counter` is exposed as
+    name_total.
+    """
+
+    def __init__(self, name, documentation, labelnames, counter=False):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.counter = counter
+        self.sample_name = name + '_total' if counter else name
+        self.max_series = 0
+
+    @property
+    def source(self):
+        # What SeriesCache builds this family from (see cardinality.CountBy)
+        return self
+
+    def sample(self, value, **labels):
+        return self, Sample(self.sample_name, {name: str(labels[name]) for name in self.labelnames}, value, None)
+
+    def sampler(self, labels, value):
+        """A function turning a record into what sample() returns, with each
+        label and the value computed from the record by the functions in
+        `labels` (by label name) and `value`."""
+        getters = tuple((name, labels[name]) for name in self.labelnames)
+        sample_name = self.sample_name
+
+        def sample(rec):
+            return self, Sample(sample_name, {name: str(get(rec)) for name, get in getters}, value(rec), None)
+
+        return sample
+
+    def family(self, samples=(), dropped=None):
+        """A family of `samples`, cut to `max_series` if set.
+
+        How many samples the cap left out is set on `dropped`, a gauge
+        labelled by metric (a cluster's ClusterMetrics.series_dropped).
+        """
+        family_type = CounterMetricFamily if self.counter else GaugeMetricFamily
+        family = family_type(self.name, self.documentation, labels=self.labelnames)
+        family.samples = list(samples)
+        if self.max_series:
+            left_out = max(0, len(family.samples) - self.max_series)
+            if left_out:
+                del family.samples[self.max_series:]
+            if dropped is not None:
+                dropped.labels(metric=self.name).set(left_out)
+        return family
+
+
+class SnapshotCollector:
+    """Serves the last published set of metric families at scrape time.
+
+    Families are grouped into named parts (one per NDK kind) so a refresh can
+    replace just the parts it rebuilt. Publishing swaps in a new immutable
+    tuple, so a scrape always sees either the old or the new snapshot in full
+    and never a half-filled family.
+    """
+
+    def __init__(self):
+        self._parts = {}
+        self._snapshot = ()
+        self._lock = threading.Lock()
+
+    def publish(self, parts):
+        with self._lock:
+            merged = dict(self._parts)
+            merged.update((name, tuple(families)) for name, families in parts.items())
+            self._parts = merged
+            self._snapshot = tuple(family for families in merged.values() for family in families)
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        return iter(self._snapshot)
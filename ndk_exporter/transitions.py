@@ -0,0 +1,160 @@
+import collections
+import threading
+import time
+
+from rollups import Table
+from snapshot import Metric
+
+# Transitions remembered per object, newest last
+HISTORY = 16
+# Window for ndk_condition_recent_transitions
+FLAP_WINDOW = 3600
+
+condition_transitions = Metric(
+    'ndk_condition_transitions',
+    'Status changes of a condition seen by the exporter, including changes between two refreshes '
+    'that show up only as a newer lastTransitionTime',
+    ['kind', 'namespace', 'name', 'type'],
+    counter=True
+)
+condition_recent_transitions = Metric(
+    'ndk_condition_recent_transitions',
+    'Status changes of a condition in the last hour (a flap indicator)',
+    ['kind', 'namespace', 'name', 'type']
+)
+condition_time_in_state = Metric(
+    'ndk_condition_time_in_state_seconds',
+    'Seconds a condition has had its current status, from its lastTransitionTime or else from when the '
+    'exporter first saw it',
+    ['kind', 'namespace', 'name', 'type', 'status']
+)
+condition_last_transition_timestamp = Metric(
+    'ndk_condition_last_transition_timestamp_seconds',
+    'lastTransitionTime of a condition as Unix timestamp in seconds',
+    ['kind', 'namespace', 'name', 'type']
+)
+
+METRICS = (
+    condition_transitions,
+    condition_recent_transitions,
+    condition_time_in_state,
+    condition_last_transition_timestamp,
+)
+
+
+class ObjectConditions:
+    """The condition state of one object and its last HISTORY transitions.
+
+    `history` holds (time seen, condition type, number of status changes).
+    """
+
+    __slots__ = ('resource_version', 'conditions', 'transitions', 'history')
+
+    def __init__(self):
+        self.resource_version = None
+        # type -> (status, since, lastTransitionTime)
+        self.conditions = {}
+        self.transitions = {}
+        self.history = collections.deque(maxlen=HISTORY)
+
+    def observe(self, conditions, now):
+        for condition in conditions:
+            last_transition = condition.last_transition_time
+            previous = self.conditions.get(condition.type)
+            if previous is None:
+                changes = 0
+            elif previous[0] != condition.status:
+                changes = 1
+            elif last_transition is not None and previous[2] is not None and last_transition > previous[2]:
+                # Same status but a newer transition: it flipped and flipped back in between
+                changes = 2
+            else:
+                self.conditions[condition.type] = previous
+                continue
+            since = last_transition if last_transition is not None else now
+            self.conditions[condition.type] = (condition.status, since, last_transition)
+            if changes:
+                self.transitions[condition.type] = self.transitions.get(condition.type, 0) + changes
+                self.history.append((now, condition.type, changes))
+
+
+class ConditionTracker:
+    """Follows every condition of the objects of the kinds it is given.
+
+    Each kind feeds its records in through a Table (a Kind rollup). Objects
+    whose resourceVersion is unchanged are skipped, and objects that are gone
+    from a kind's records are forgotten, so the state never outgrows the
+    objects that exist.
+    """
+
+    def __init__(self, dropped=None):
+        self.dropped = dropped
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def table(self, plural):
+        return Table(self, plural)
+
+    def update(self, plural, records):
+        now = time.time()
+        with self._lock:
+            previous = self._objects.get(plural, {})
+            current = {}
+            for rec in records:
+                key = (rec.namespace or '', rec.name)
+                state = previous.get(key)
+                if state is None:
+                    state = ObjectConditions()
+                if state.resource_version != rec.resource_version or rec.resource_version is None:
+                    state.observe(rec.conditions, now)
+                    state.resource_version = rec.resource_version
+                current[key] = state
+            self._objects[plural] = current
+
+    def state(self):
+        """Everything tracked, as plain tuples, to be saved for a warm start."""
+        with self._lock:
+            return {plural: {key: (state.resource_version, dict(state.conditions), dict(state.transitions),
+                                   tuple(state.history))
+                             for key, state in objects.items()}
+                    for plural, objects in self._objects.items()}
+
+    def restore(self, saved):
+        """Pick up from state(), before the first update()."""
+        objects = {}
+        for plural, saved_objects in saved.items():
+            objects[plural] = {}
+            for key, (resource_version, conditions, transitions, history) in saved_objects.items():
+                state = objects[plural][key] = ObjectConditions()
+                state.resource_version = resource_version
+                state.conditions = conditions
+                state.transitions = transitions
+                state.history.extend(history)
+        with self._lock:
+            self._objects = objects
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        samples = {metric: [] for metric in METRICS}
+        with self._lock:
+            for metric, sample in self.samples(time.time()):
+                samples[metric].append(sample)
+        return [metric.family(samples[metric], self.dropped) for metric in METRICS]
+
+    def samples(self, now):
+        for plural, objects in self._objects.items():
+            for (namespace, name), state in objects.items():
+                recent = collections.Counter()
+                for at, condition_type, changes in state.history:
+                    if at >= now - FLAP_WINDOW:
+                        recent[condition_type] += changes
+                for condition_type, (status, since, last_transition) in state.conditions.items():
+                    labels = {'kind': plural, 'namespace': namespace, 'name': name, 'type': condition_type}
+                    yield condition_transitions.sample(state.transitions.get(condition_type, 0), **labels)
+                    yield condition_recent_transitions.sample(recent[condition_type], **labels)
+                    yield condition_time_in_state.sample(max(0, now - since), status=status, **labels)
+                    if last_transition is not None:
+                        yield condition_last_transition_timestamp.sample(last_transition, **labels)
+
@@ -0,0 +1,82 @@
+import os
+import pickle
+import threading
+import time
+import zlib
+
+# Bumped whenever the layout of the saved state changes; older files are ignored
+FORMAT = 4
+# zlib level for the state file: it is written in the background, and most of
+# its size is repeated names and label values that compress well at any level
+ZLIB_LEVEL = 3
+
+
+def dump(path, state):
+    """Write `state` to `path` atomically: a crash mid-write leaves the previous file in place."""
+    data = zlib.compress(pickle.dumps(dict(state, format=FORMAT), protocol=pickle.HIGHEST_PROTOCOL), ZLIB_LEVEL)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as out:
+        out.write(data)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp, path)
+    return len(data)
+
+
+def load(path, max_age):
+    """The state saved in `path`, or None if there is none or it is unusable or older than `max_age` seconds.
+
+    The file is unpickled, so it must only be writable by the exporter.
+    """
+    try:
+        with open(path, 'rb') as saved:
+            state = pickle.loads(zlib.decompress(saved.read()))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Ignoring saved state in {path}: {e}")
+        return None
+    if not isinstance(state, dict) or state.get('format') != FORMAT:
+        print(f"Ignoring saved state in {path}: written by another version of the exporter")
+        return None
+    age = time.time() - state.get('saved_at', 0)
+    if age > max_age:
+        print(f"Ignoring saved state in {path}: {age:.0f}s old")
+        return None
+    return state
+
+
+class StateWriter:
+    """Saves the exporter's state in the background, at most every `interval` seconds.
+
+    changed() is called after refreshes publish; the writer then waits out
+    the rest of the interval, calls `gather` for the state and writes it,
+    so refresh loops never wait for pickling or the disk.
+    """
+
+    def __init__(self, path, interval, gather):
+        self.path = path
+        self.interval = interval
+        self.gather = gather
+        self._changed = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='state-writer', daemon=True)
+        self._thread.start()
+
+    def changed(self):
+        self._changed.set()
+
+    def run(self):
+        while True:
+            self._changed.wait()
+            self._changed.clear()
+            started = time.monotonic()
+            try:
+                size = dump(self.path, dict(self.gather(), saved_at=time.time()))
+            except Exception as e:
+                print(f"Error saving state to {self.path}: {e}")
+            else:
+                print(f"Saved state to {self.path} ({size / 1e6:.1f} MB in {time.monotonic() - started:.1f}s)")
+            time.sleep(max(0, started + self.interval - time.monotonic()))
@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+
+import pytest
+
+# The exporter's modules import each other by name, as when run from ndk_exporter/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ndk_exporter'))
+
+
+class Response:
+    def __init__(self, body):
+        self.data = json.dumps(body).encode()
+
+    def release_conn(self):
+        pass
+
+
+class WatchResponse:
+    def __init__(self, events):
+        self.body = b''.join(json.dumps(event).encode() + b'\n' for event in events)
+
+    def stream(self, amt=None, decode_content=True):
+        # Split lines across chunks, as a real stream does
+        for start in range(0, len(self.body), 7):
+            yield self.body[start:start + 7]
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class FakeCustomObjectsApi:
+    """Serves every LIST from `objects`, a dict of plural -> list of objects, in one page
+    (only the namespace's objects for a namespaced LIST), and every WATCH as the events in `events`. The keyword arguments of each call
+    are kept in `calls`."""
+
+    def __init__(self, objects=None, events=()):
+        self.objects = objects or {}
+        self.events = list(events)
+        self.calls = []
+
+    def list_cluster_custom_object(self, group, version, plural, **kwargs):
+        self.calls.append(kwargs)
+        if kwargs.get('watch'):
+            return WatchResponse(self.events)
+        items = self.objects.get(plural, [])
+        return Response({'metadata': {'resourceVersion': '1'}, 'items': items})
+
+    def list_namespaced_custom_object(self, group, version, namespace, plural, **kwargs):
+        self.calls.append(dict(kwargs, namespace=namespace))
+        items = [obj for obj in self.objects.get(plural, []) if obj['metadata'].get('namespace') == namespace]
+        return Response({'metadata': {'resourceVersion': '1'}, 'items': items})
+
+
+@pytest.fixture
+def fake_api():
+    return FakeCustomObjectsApi
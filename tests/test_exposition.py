@@ -0,0 +1,98 @@
+import gzip
+import http.client
+import time
+
+import pytest
+from prometheus_client import CollectorRegistry, Gauge
+
+from exposition import ExpositionCache, accepts_gzip, negotiate, start_exposition_server
+
+
+@pytest.fixture
+def served():
+    registry = CollectorRegistry()
+    gauge = Gauge('ndk_test_value', 'A value', registry=registry)
+    gauge.set(1)
+    cache = ExpositionCache(registry)
+    cache.render()
+    codes = []
+    server = start_exposition_server(0, cache, on_scrape=codes.append, addr='127.0.0.1')
+    yield gauge, cache, codes, server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def scrape(port, method='GET', **headers):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    try:
+        conn.request(method, '/metrics', headers=headers)
+        resp = conn.getresponse()
+        return resp.status, dict(resp.getheaders()), resp.read()
+    finally:
+        conn.close()
+
+
+def test_negotiation():
+    assert negotiate(None) == 'text'
+    assert negotiate('text/plain;version=0.0.4') == 'text'
+    assert negotiate('application/openmetrics-text;version=1.0.0,text/plain;q=0.5') == 'openmetrics'
+    assert accepts_gzip('gzip, deflate') and not accepts_gzip(None) and not accepts_gzip('identity')
+
+
+def test_etag_gets_a_304_until_the_data_changes(served):
+    gauge, cache, codes, port = served
+    status, headers, body = scrape(port)
+    assert status == 200 and b'ndk_test_value 1.0' in body
+    assert headers['Content-Type'].startswith('text/plain')
+    etag = headers['ETag']
+
+    status, headers, body = scrape(port, **{'If-None-Match': etag})
+    assert (status, body, headers['ETag'], headers['Content-Length']) == (304, b'', etag, '0')
+
+    # Rendering the same data keeps the ETag
+    cache.render()
+    assert scrape(port, **{'If-None-Match': etag})[0] == 304
+
+    gauge.set(2)
+    cache.render()
+    status, headers, body = scrape(port, **{'If-None-Match': etag})
+    assert status == 200 and b'ndk_test_value 2.0' in body and headers['ETag'] != etag
+    # on_scrape runs once the response is out, so it may lag the client
+    deadline = time.monotonic() + 5
+    while len(codes) < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert codes == [200, 304, 304, 200]
+
+
+def test_gzip_is_served_to_scrapers_that_accept_it(served):
+    _, _, _, port = served
+    _, plain_headers, plain = scrape(port)
+    status, headers, body = scrape(port, **{'Accept-Encoding': 'gzip'})
+    assert status == 200 and headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(body) == plain
+    assert headers['Vary'] == 'Accept, Accept-Encoding'
+    # Each encoding has its own ETag, so a cache never mixes them up
+    assert headers['ETag'] != plain_headers['ETag']
+    assert scrape(port, **{'Accept-Encoding': 'gzip', 'If-None-Match': plain_headers['ETag']})[0] == 200
+    status, headers, body = scrape(port, **{'Accept-Encoding': 'gzip', 'If-None-Match': headers['ETag']})
+    assert (status, body) == (304, b'') and 'Content-Encoding' not in headers
+
+
+def test_openmetrics_is_rendered_once_asked_for(served):
+    gauge, cache, _, port = served
+    accept = {'Accept': 'application/openmetrics-text;version=1.0.0'}
+    status, headers, body = scrape(port, **accept)
+    assert status == 200 and headers['Content-Type'].startswith('application/openmetrics-text')
+    assert body.endswith(b'# EOF\n')
+    # From now on every render() includes it
+    gauge.set(3)
+    cache.render()
+    assert b'ndk_test_value 3.0' in scrape(port, **accept)[2]
+
+
+def test_head_sends_headers_only(served):
+    _, _, _, port = served
+    _, get_headers, body = scrape(port)
+    status, headers, head_body = scrape(port, 'HEAD')
+    assert (status, head_body) == (200, b'')
+    assert headers['Content-Length'] == str(len(body)) and headers['ETag'] == get_headers['ETag']
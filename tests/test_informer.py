@@ -0,0 +1,129 @@
+import time
+
+import pytest
+from kubernetes.client.rest import ApiException
+from prometheus_client import CollectorRegistry
+
+from informer import Informer
+from selfmetrics import ClusterMetrics
+
+
+def obj(namespace, name, resource_version, phase='Ready'):
+    return {'metadata': {'namespace': namespace, 'name': name, 'resourceVersion': resource_version},
+            'status': {'phase': phase}}
+
+
+def informer(api, **kwargs):
+    return Informer(api, 'dataservices.nutanix.com', 'v1alpha1', 'applications', ClusterMetrics(CollectorRegistry()),
+                    **kwargs)
+
+
+def store(informer):
+    return {key: item['metadata']['resourceVersion'] for key, item in informer.snapshot()[1]}
+
+
+def test_relist_then_watch_applies_events(fake_api):
+    api = fake_api({'applications': [obj('a', 'x', '1'), obj('a', 'y', '1')]}, [
+        {'type': 'ADDED', 'object': obj('a', 'z', '5')},
+        {'type': 'MODIFIED', 'object': obj('a', 'x', '6')},
+        {'type': 'DELETED', 'object': obj('a', 'y', '7')},
+    ])
+    watched = informer(api)
+    watched.relist()
+    assert watched.synced and watched.current and watched.take_dirty()
+    watched.watch()
+    assert store(watched) == {('a', 'x'): '6', ('a', 'z'): '5'}
+    assert watched.resource_version == '7'
+    assert watched.take_dirty()
+    assert api.calls[-1]['resource_version'] == '1'
+
+
+def test_bookmark_only_advances_resource_version(fake_api):
+    api = fake_api(events=[{'type': 'BOOKMARK', 'object': {'metadata': {'resourceVersion': '9'}}}])
+    watched = informer(api)
+    watched.restore('3', [(('a', 'x'), obj('a', 'x', '2'))])
+    watched.take_dirty()
+    watched.watch()
+    assert watched.resource_version == '9'
+    assert store(watched) == {('a', 'x'): '2'}
+    assert not watched.take_dirty()
+
+
+def test_restored_store_is_current_once_the_watch_is_accepted(fake_api):
+    notified = []
+    watched = informer(fake_api(), on_change=lambda: notified.append(True))
+    watched.restore('3', [])
+    assert watched.synced and not watched.current
+    watched.watch()
+    assert watched.current and notified
+
+
+def test_expired_watch_relists(fake_api):
+    api = fake_api(events=[
+        {'type': 'ADDED', 'object': obj('a', 'x', '4')},
+        {'type': 'ERROR', 'object': {'kind': 'Status', 'code': 410, 'message': 'too old resource version'}},
+        {'type': 'ADDED', 'object': obj('a', 'y', '5')},
+    ])
+    watched = informer(api)
+    watched.restore('3', [])
+    watched.watch()
+    # The next pass of run() relists, and nothing after the error is applied
+    assert watched.resource_version is None
+    assert not watched.current
+    assert store(watched) == {('a', 'x'): '4'}
+
+
+def test_other_watch_errors_are_raised(fake_api):
+    watched = informer(fake_api(events=[{'type': 'ERROR', 'object': {'code': 500, 'message': 'internal'}}]))
+    watched.restore('3', [])
+    with pytest.raises(ApiException):
+        watched.watch()
+    assert watched.resource_version == '3'
+
+
+def test_objects_outside_kept_namespaces_are_not_stored(fake_api):
+    api = fake_api({'applications': [obj('a', 'x', '1'), obj('b', 'x', '1')]}, [
+        {'type': 'ADDED', 'object': obj('b', 'y', '5')},
+        {'type': 'ADDED', 'object': obj('a', 'y', '6')},
+    ])
+    watched = informer(api, keep=lambda namespace: namespace == 'a')
+    watched.relist()
+    watched.watch()
+    assert store(watched) == {('a', 'x'): '1', ('a', 'y'): '6'}
+    assert watched.resource_version == '6'
+
+
+def test_relist_pages_have_a_timeout(fake_api):
+    api = fake_api({'applications': [obj('a', 'x', '1')]})
+    informer(api).relist()
+    informer(api, list_timeout=20).relist()
+    assert [call['_request_timeout'] for call in api.calls] == [60, 20]
+
+
+class Stop(BaseException):
+    pass
+
+
+def test_failing_watch_marks_the_store_stale(fake_api, monkeypatch):
+    def refused(*args, **kwargs):
+        raise ApiException(status=503, reason='Service Unavailable')
+
+    def stop(seconds):
+        raise Stop()
+
+    monkeypatch.setattr(time, 'sleep', stop)
+    notified = []
+    api = fake_api({'applications': [obj('a', 'x', '1')]})
+    watched = informer(api, on_change=lambda: notified.append(True))
+    watched.relist()
+    notified.clear()
+    api.list_cluster_custom_object = refused
+    with pytest.raises(Stop):
+        watched.run()
+    assert not watched.current and notified
+    assert [sample.value for sample in watched.metrics.errors.collect()[0].samples
+            if sample.name == 'ndk_exporter_errors_total'] == [1]
+    # An accepted watch makes it current again
+    del api.list_cluster_custom_object
+    watched.watch()
+    assert watched.current
@@ -0,0 +1,98 @@
+from collections import namedtuple
+
+import pytest
+from prometheus_client import CollectorRegistry
+
+from latency import LatencyTracker, RestoreLatency, SnapshotReadyLatency
+
+Snapshot = namedtuple('Snapshot', ['uid', 'namespace', 'ready_to_use', 'created'])
+Restore = namedtuple('Restore', ['uid', 'namespace', 'completed', 'start_time', 'finish_time'])
+
+STARTED = 1000
+
+
+def samples(tracker, suffix):
+    [family] = tracker.histogram.collect()
+    return [sample for sample in family.samples if sample.name.endswith(suffix)]
+
+
+def count(tracker):
+    return sum(sample.value for sample in samples(tracker, '_count'))
+
+
+def buckets(tracker):
+    return {sample.labels['le']: sample.value for sample in samples(tracker, '_bucket')}
+
+
+def test_latency_must_be_implemented():
+    with pytest.raises(TypeError):
+        LatencyTracker(None)
+
+
+def test_snapshot_seen_not_ready_is_observed_once():
+    tracker = SnapshotReadyLatency(CollectorRegistry(), started=STARTED, interval=30)
+    tracker.update([Snapshot('a', 'ns', False, 990)], now=1010)
+    tracker.update([Snapshot('a', 'ns', True, 990)], now=1040)
+    tracker.update([Snapshot('a', 'ns', True, 990)], now=1070)
+    assert count(tracker) == 1
+    assert (buckets(tracker)['30.0'], buckets(tracker)['60.0']) == (0, 1)
+
+
+def test_snapshots_done_before_the_start_are_skipped():
+    tracker = SnapshotReadyLatency(CollectorRegistry(), started=STARTED, interval=30)
+    tracker.update([Snapshot('old', 'ns', True, 900), Snapshot('new', 'ns', True, 1005)], now=1010)
+    assert count(tracker) == 1
+
+
+def test_unchanged_refreshes_keep_the_observation_accurate():
+    tracker = SnapshotReadyLatency(CollectorRegistry(), started=STARTED, interval=30)
+    tracker.update([Snapshot('a', 'ns', False, 1000)], now=1000)
+    for now in range(1030, 1300, 30):
+        tracker.checked(now)
+    tracker.update([Snapshot('a', 'ns', True, 1000)], now=1300)
+    assert count(tracker) == 1
+
+
+def test_snapshot_ready_after_missed_refreshes_is_not_observed():
+    tracker = SnapshotReadyLatency(CollectorRegistry(), started=STARTED, interval=30)
+    tracker.update([Snapshot('a', 'ns', False, 1000)], now=1000)
+    # Refreshes failed for five minutes
+    tracker.update([Snapshot('a', 'ns', True, 1000)], now=1300)
+    assert count(tracker) == 0
+    # and it is not observed later either
+    tracker.update([Snapshot('a', 'ns', True, 1000)], now=1330)
+    assert count(tracker) == 0
+
+
+def test_uids_are_not_counted_twice_across_restarts():
+    first = SnapshotReadyLatency(CollectorRegistry(), started=STARTED, interval=30)
+    records = [Snapshot('done', 'ns', False, 1000), Snapshot('pending', 'ns', False, 1000)]
+    first.update(records, now=1000)
+    first.update([Snapshot('done', 'ns', True, 1000), Snapshot('pending', 'ns', False, 1000)], now=1030)
+    assert count(first) == 1
+
+    # A restart 20 seconds later picks up the saved state
+    second = SnapshotReadyLatency(CollectorRegistry(), started=1050, interval=30)
+    second.restore(first.state())
+    second.update([Snapshot('done', 'ns', True, 1000), Snapshot('pending', 'ns', True, 1000)], now=1060)
+    # Only the snapshot seen pending got counted, and only once
+    assert count(second) == 1
+    second.update([Snapshot('done', 'ns', True, 1000), Snapshot('pending', 'ns', True, 1000)], now=1090)
+    assert count(second) == 1
+
+
+def test_long_restarts_skip_snapshots_that_got_ready_meanwhile():
+    first = SnapshotReadyLatency(CollectorRegistry(), started=STARTED, interval=30)
+    first.update([Snapshot('a', 'ns', False, 1000)], now=1000)
+    second = SnapshotReadyLatency(CollectorRegistry(), started=2000, interval=30)
+    second.restore(first.state())
+    second.update([Snapshot('a', 'ns', True, 1000)], now=2000)
+    assert count(second) == 0
+
+
+def test_restore_duration_is_exact_after_any_gap():
+    tracker = RestoreLatency(CollectorRegistry(), started=STARTED)
+    tracker.update([Restore('r', 'ns', None, 1000, None)], now=1000)
+    tracker.update([Restore('r', 'ns', True, 1000, 1100)], now=5000)
+    assert count(tracker) == 1
+    assert (buckets(tracker)['60.0'], buckets(tracker)['120.0']) == (0, 1)
@@ -0,0 +1,94 @@
+import pytest
+from kubernetes.client.rest import ApiException
+from prometheus_client import CollectorRegistry
+
+import ndk_exporter
+from conftest import Response
+from listing import ContinueExpired, ListPager
+
+GROUP = 'dataservices.nutanix.com'
+VERSION = 'v1alpha1'
+
+
+def snapshot(name, version):
+    return {'metadata': {'name': name, 'namespace': 'ns', 'resourceVersion': version}}
+
+
+class PagedApi:
+    """Serves `lists` (successive snapshots of the cluster, each a list of
+    objects) in pages of `limit`. The continue token of the first `expire`
+    paged requests has expired, which moves the cluster on to its next
+    snapshot, as a compaction would."""
+
+    def __init__(self, lists, expire=0):
+        self.lists = list(lists)
+        self.expire = expire
+        self.calls = []
+        self.bytes = 0
+
+    def list_cluster_custom_object(self, group, version, plural, limit=None, _continue=None, **kwargs):
+        self.calls.append(_continue)
+        if _continue and self.expire:
+            self.expire -= 1
+            self.lists.pop(0)
+            raise ApiException(status=410, reason='Expired')
+        objects = self.lists[0]
+        start = int(_continue or 0)
+        end = start + limit if limit else len(objects)
+        metadata = {'resourceVersion': objects[0]['metadata']['resourceVersion']}
+        if end < len(objects):
+            metadata['continue'] = str(end)
+        resp = Response({'metadata': metadata, 'items': objects[start:end]})
+        self.bytes += len(resp.data)
+        return resp
+
+
+def test_pages_are_followed_with_their_continue_tokens():
+    objects = [snapshot(f's{i}', '7') for i in range(5)]
+    api = PagedApi([objects])
+    pager = ListPager(api, GROUP, VERSION, 'applicationsnapshots', page_size=2)
+    assert [item['metadata']['name'] for item in pager] == [f's{i}' for i in range(5)]
+    assert api.calls == [None, '2', '4']
+    assert (pager.items, pager.resource_version) == (5, '7')
+    assert pager.bytes == api.bytes
+
+
+def test_an_expired_continue_token_raises_continue_expired():
+    api = PagedApi([[snapshot(f's{i}', '1') for i in range(4)], [snapshot('t', '2')]], expire=1)
+    pager = ListPager(api, GROUP, VERSION, 'applicationsnapshots', page_size=2)
+    with pytest.raises(ContinueExpired):
+        list(pager)
+
+
+def test_a_410_on_the_first_page_is_not_an_expired_continue():
+    class GoneApi:
+        def list_cluster_custom_object(self, *args, **kwargs):
+            raise ApiException(status=410, reason='Gone')
+
+    with pytest.raises(ApiException) as raised:
+        list(ListPager(GoneApi(), GROUP, VERSION, 'applicationsnapshots'))
+    assert not isinstance(raised.value, ContinueExpired)
+
+
+def test_refresh_restarts_a_list_whose_continue_token_expired(monkeypatch):
+    monkeypatch.setattr(ndk_exporter, 'PAGE_SIZE', 2)
+    old = [snapshot(f'old{i}', '1') for i in range(4)]
+    new = [snapshot(f'new{i}', '2') for i in range(3)]
+    api = PagedApi([old, new], expire=1)
+    cluster = ndk_exporter.Cluster('', api, CollectorRegistry())
+    kind = next(kind for kind in ndk_exporter.KINDS if kind.plural == 'applicationsnapshots')
+    assert ndk_exporter.refresh(cluster, kind)
+    assert api.calls == [None, '2', None, '2']
+    # Nothing from the first page of the expired list was kept
+    assert sorted(rec.name for rec in cluster.caches[kind.plural].records()) == ['new0', 'new1', 'new2']
+
+
+def test_refresh_gives_up_after_list_attempts(monkeypatch):
+    monkeypatch.setattr(ndk_exporter, 'PAGE_SIZE', 1)
+    lists = [[snapshot('a', str(i)), snapshot('b', str(i))] for i in range(ndk_exporter.LIST_ATTEMPTS + 1)]
+    api = PagedApi(lists, expire=ndk_exporter.LIST_ATTEMPTS)
+    cluster = ndk_exporter.Cluster('', api, CollectorRegistry())
+    kind = next(kind for kind in ndk_exporter.KINDS if kind.plural == 'applicationsnapshots')
+    with pytest.raises(ContinueExpired):
+        ndk_exporter.refresh(cluster, kind)
+    assert cluster.caches[kind.plural].records() == []
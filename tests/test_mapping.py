@@ -0,0 +1,54 @@
+import pytest
+
+from mapping import compile_kind
+
+ROLLUPS = {
+    'relationships': (('applications',), ()),
+    'transitions': (None, ('conditions',)),
+}
+
+
+def spec(plural='applications', rollups=(), **fields):
+    return {'plural': plural, 'group': 'dataservices.nutanix.com', 'version': 'v1alpha1', 'kind': 'Thing',
+            'fields': dict(name='metadata.name', namespace='metadata.namespace', **fields),
+            'metrics': [{'name': 'thing_info', 'labels': {'name': 'name'}}], 'rollups': list(rollups)}
+
+
+def test_known_rollups_compile():
+    kind = compile_kind(spec(rollups=['relationships', 'transitions'], conditions='status.conditions'),
+                        rollups=ROLLUPS)
+    assert kind.rollups == ('relationships', 'transitions')
+
+
+@pytest.mark.parametrize('plural, rollups, message', [
+    ('applications', ['api'], "unknown rollup 'api'"),
+    ('storageclusters', ['relationships'], "rollup 'relationships' only reads applications"),
+    ('applications', ['transitions'], "rollup 'transitions' needs fields conditions"),
+])
+def test_unusable_rollups_are_rejected(plural, rollups, message):
+    with pytest.raises(ValueError, match=message):
+        compile_kind(spec(plural, rollups), rollups=ROLLUPS)
+
+
+def test_unknown_fields_are_rejected():
+    bad = spec()
+    bad['metrics'][0]['labels']['phase'] = 'phase|lower'
+    with pytest.raises(ValueError, match="unknown field 'phase'"):
+        compile_kind(bad)
+
+
+def test_timestamps_are_parsed_once():
+    kind = compile_kind({
+        'plural': 'things', 'group': 'example.com', 'version': 'v1', 'kind': 'Thing',
+        'fields': {'name': 'metadata.name', 'namespace': 'metadata.namespace',
+                   'created': ['metadata.creationTimestamp', None, 'timestamp']},
+        'metrics': [{'name': 'thing_created', 'labels': {'name': 'name'}, 'value': 'created|timestamp_ms'}],
+    })
+    rec = kind.fields.project({'metadata': {'name': 'a', 'namespace': 'ns',
+                                            'creationTimestamp': '2026-10-17T08:00:00.750Z'}})
+    assert rec.created == 1792224000
+    # The filter works on the converted seconds, so the sub-second part is gone
+    [(_, sample)] = kind.series(rec)
+    assert sample.value == 1792224000000
+    [(_, sample)] = kind.series(rec._replace(created=None))
+    assert sample.value == 0
@@ -0,0 +1,82 @@
+import pytest
+from kubernetes.client.rest import ApiException
+
+from scheduler import JITTER, MAX_BACKOFF, SPEEDUP_FLOOR, KindSchedule, retry_after
+
+
+def api_error(status, retry=None):
+    error = ApiException(status=status, reason='error')
+    error.headers = {'Retry-After': retry} if retry is not None else {}
+    return error
+
+
+def test_quiet_kinds_are_refreshed_every_interval():
+    schedule = KindSchedule(30, rand=lambda: 0.5)
+    schedule.succeeded(False, now=100)
+    assert schedule.due == 130
+    schedule.succeeded(False, now=130)
+    assert schedule.due == 160
+
+
+@pytest.mark.parametrize('rand, factor', [(0.0, 1 - JITTER), (1.0, 1 + JITTER)])
+def test_jitter_moves_refreshes_both_ways(rand, factor):
+    schedule = KindSchedule(30, rand=lambda: rand)
+    schedule.succeeded(False, now=0)
+    assert schedule.due == pytest.approx(30 * factor)
+
+
+def test_changes_speed_refreshes_up_and_quiet_slows_them_back():
+    schedule = KindSchedule(40, rand=lambda: 0.5)
+    # Filling the cache is not a change
+    schedule.succeeded(True, now=0)
+    assert schedule.current == 40
+    waits = []
+    for changed in (True, True, True, False, False, False):
+        schedule.succeeded(changed, now=0)
+        waits.append(schedule.current)
+    assert waits == [20, 40 * SPEEDUP_FLOOR, 40 * SPEEDUP_FLOOR, 40, 40, 40]
+
+
+def test_failures_back_off_exponentially_up_to_the_cap():
+    schedule = KindSchedule(30, rand=lambda: 1.0)
+    delays = []
+    for _ in range(6):
+        schedule.failed(RuntimeError('down'), now=1000)
+        delays.append(schedule.due - 1000)
+    assert delays == [60, 120, 240, 480, MAX_BACKOFF, MAX_BACKOFF]
+
+
+def test_backoff_jitter_waits_at_least_half():
+    schedule = KindSchedule(30, rand=lambda: 0.0)
+    schedule.failed(RuntimeError('down'), now=0)
+    assert schedule.due == 30
+
+
+def test_success_resets_the_backoff():
+    schedule = KindSchedule(30, rand=lambda: 1.0)
+    for _ in range(3):
+        schedule.failed(RuntimeError('down'), now=0)
+    schedule.succeeded(False, now=0)
+    schedule.failed(RuntimeError('down'), now=0)
+    assert schedule.due == 60
+
+
+def test_retry_after_is_waited_out():
+    schedule = KindSchedule(30, rand=lambda: 1.0)
+    schedule.failed(api_error(429, '300'), now=0)
+    assert schedule.due == 300
+    # A shorter Retry-After does not cut the backoff short
+    schedule.failed(api_error(429, '5'), now=0)
+    assert schedule.due == 120
+
+
+@pytest.mark.parametrize('error, seconds', [
+    (api_error(429, '12'), 12),
+    (api_error(503, '1.5'), 1.5),
+    (api_error(500, '12'), None),
+    (api_error(429, 'Wed, 21 Oct 2026 07:28:00 GMT'), None),
+    (api_error(429), None),
+    (RuntimeError('down'), None),
+])
+def test_retry_after(error, seconds):
+    assert retry_after(error) == seconds
@@ -0,0 +1,124 @@
+import datetime
+from collections import namedtuple
+
+import pytest
+
+from schedules import Interval, calendar, schedule
+
+JobScheduler = namedtuple('JobScheduler', ['timezone', 'interval', 'daily', 'weekly', 'monthly', 'cron_schedule',
+                                           'start_time', 'start_at', 'created'], defaults=[None] * 9)
+
+
+def at(text):
+    return datetime.datetime.fromisoformat(text).replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def utc(t):
+    return datetime.datetime.fromtimestamp(t, datetime.timezone.utc).isoformat(timespec='minutes')[:16]
+
+
+def runs(scheduled, start, count):
+    found = []
+    t = at(start)
+    for _ in range(count):
+        t = scheduled.next_after(t)
+        found.append(utc(t))
+    return found
+
+
+def test_cron_fields():
+    daily = calendar('*/15 9-17 * jan,jul mon-fri', 'UTC')
+    assert daily.minutes == (0, 15, 30, 45)
+    assert daily.hours == tuple(range(9, 18))
+    assert daily.months == {1, 7}
+    assert daily.weekdays == {1, 2, 3, 4, 5}
+    # 7 is Sunday as well as 0, and a stepped single value runs to the end of the range
+    assert calendar('0 0 * * 7', 'UTC').weekdays == {0}
+    assert calendar('50/5 0 * * *', 'UTC').minutes == (50, 55)
+    assert calendar('@hourly', 'UTC').minutes == (0,)
+
+
+@pytest.mark.parametrize('expression', ['* * * *', '60 * * * *', '* 24 * * *', '* * 0 * *', '*/0 * * * *'])
+def test_invalid_cron_expressions(expression):
+    with pytest.raises(ValueError):
+        calendar(expression, 'UTC')
+
+
+def test_day_of_month_or_weekday():
+    # Restricting both fields matches either: the 13th and every Friday
+    scheduled = calendar('0 0 13 * fri', 'UTC')
+    assert runs(scheduled, '2026-10-08T12:00', 3) == ['2026-10-09T00:00', '2026-10-13T00:00', '2026-10-16T00:00']
+    # Restricting one leaves the other out of it
+    assert runs(calendar('0 0 13 * *', 'UTC'), '2026-10-08T12:00', 2) == ['2026-10-13T00:00', '2026-11-13T00:00']
+    assert runs(calendar('0 0 * * fri', 'UTC'), '2026-10-08T12:00', 2) == ['2026-10-09T00:00', '2026-10-16T00:00']
+
+
+def test_leap_day():
+    scheduled = calendar('0 0 29 2 *', 'UTC')
+    assert utc(scheduled.next_after(at('2026-03-01T00:00'))) == '2028-02-29T00:00'
+    assert utc(scheduled.previous_at(at('2026-03-01T00:00'))) == '2024-02-29T00:00'
+
+
+def test_cron_tz_overrides_the_time_zone():
+    scheduled = calendar('CRON_TZ=America/New_York 0 9 * * *', 'UTC')
+    assert runs(scheduled, '2026-07-01T00:00', 1) == ['2026-07-01T13:00']
+    assert calendar('TZ=Asia/Kolkata 0 9 * * *', 'UTC').tz.key == 'Asia/Kolkata'
+    with pytest.raises(ValueError, match='unknown time zone'):
+        calendar('CRON_TZ=Mars/Olympus 0 9 * * *', 'UTC')
+
+
+def test_daily_run_across_spring_forward():
+    # Europe/Berlin skips 02:00-03:00 on 2026-03-29; that day's 02:30 run happens at 03:30 CEST
+    scheduled = schedule(JobScheduler(timezone='Europe/Berlin', daily={'time': '02:30'}))
+    assert runs(scheduled, '2026-03-27T12:00', 3) == ['2026-03-28T01:30', '2026-03-29T01:30', '2026-03-30T00:30']
+
+
+def test_daily_run_across_fall_back():
+    # Europe/Berlin has 02:00-03:00 twice on 2026-10-25; the run happens once, at the first 02:30
+    scheduled = schedule(JobScheduler(timezone='Europe/Berlin', daily={'time': '02:30'}))
+    assert runs(scheduled, '2026-10-23T12:00', 3) == ['2026-10-24T00:30', '2026-10-25T00:30', '2026-10-26T01:30']
+    assert utc(scheduled.previous_at(at('2026-10-26T00:00'))) == '2026-10-25T00:30'
+
+
+def test_window_across_a_dst_change():
+    scheduled = schedule(JobScheduler(timezone='Europe/Berlin', cron_schedule='0 3 * * *'))
+    before = at('2026-10-25T00:00')
+    previous, following = scheduled.window(before)
+    assert (utc(previous), utc(following)) == ('2026-10-24T01:00', '2026-10-25T02:00')
+    # Asking again within the window gives the same answer
+    assert scheduled.window(before + 3600) == (previous, following)
+    previous, following = scheduled.window(following)
+    assert (utc(previous), utc(following)) == ('2026-10-25T02:00', '2026-10-26T02:00')
+
+
+def test_interval_ignores_the_time_zone():
+    scheduled = schedule(JobScheduler(timezone='Europe/Berlin', interval={'hours': 1},
+                                      created=at('2026-10-25T00:10')))
+    assert isinstance(scheduled, Interval)
+    assert runs(scheduled, '2026-10-25T00:30', 3) == ['2026-10-25T01:10', '2026-10-25T02:10', '2026-10-25T03:10']
+
+
+def test_weekly_and_monthly_specs():
+    weekly = schedule(JobScheduler(timezone='UTC', weekly={'days': 'Monday,Thursday', 'time': '06:00'}))
+    assert runs(weekly, '2026-10-17T00:00', 2) == ['2026-10-19T06:00', '2026-10-22T06:00']
+    monthly = schedule(JobScheduler(timezone='UTC', monthly={'dates': [1, 15], 'time': '23:45'}))
+    assert runs(monthly, '2026-10-17T00:00', 2) == ['2026-11-01T23:45', '2026-11-15T23:45']
+
+
+def test_one_time_and_empty_specs():
+    once = schedule(JobScheduler(start_time='2026-10-20T10:00:00Z', start_at=at('2026-10-20T10:00')))
+    assert once.window(at('2026-10-17T00:00')) == (None, at('2026-10-20T10:00'))
+    assert once.window(at('2026-10-21T00:00')) == (at('2026-10-20T10:00'), None)
+    assert schedule(JobScheduler()) is None
+
+
+@pytest.mark.parametrize('rec', [
+    JobScheduler(interval={'minutes': 0}),
+    JobScheduler(daily={'time': 'noon'}),
+    JobScheduler(daily={}),
+    JobScheduler(timezone='Nowhere/Special', daily={'time': '01:00'}),
+    JobScheduler(start_time='tomorrow'),
+])
+def test_malformed_specs(rec):
+    with pytest.raises(ValueError):
+        schedule(rec)
@@ -0,0 +1,101 @@
+from collections import namedtuple
+
+from prometheus_client import CollectorRegistry
+
+import ndk_exporter
+from cardinality import NamespaceFilter
+from projection import Fields
+from selfmetrics import ClusterMetrics
+from series import SeriesCache
+from snapshot import Metric
+
+Record = namedtuple('Record', ['namespace', 'name', 'resource_version', 'phase'])
+
+info = Metric('test_info', 'Test objects', ['namespace', 'name', 'phase'])
+series = info.sampler({'namespace': lambda rec: rec.namespace, 'name': lambda rec: rec.name,
+                       'phase': lambda rec: rec.phase}, lambda rec: 1)
+
+
+def samples(cache):
+    return sorted((sample.labels['namespace'], sample.labels['name'], sample.labels['phase'])
+                  for family in cache.families for sample in family.samples)
+
+
+def test_first_update_of_empty_kind_reports_change():
+    cache = SeriesCache([info], lambda rec: [series(rec)])
+    assert cache.update([])
+    assert cache.records() == []
+    assert not cache.update([])
+
+
+def test_update_only_reports_real_changes():
+    cache = SeriesCache([info], lambda rec: [series(rec)])
+    assert cache.update([Record('a', 'x', '1', 'Ready'), Record('a', 'y', '1', 'Ready')])
+    assert not cache.update([Record('a', 'x', '1', 'Ready'), Record('a', 'y', '1', 'Ready')])
+    assert cache.update([Record('a', 'x', '2', 'Failed'), Record('a', 'y', '1', 'Ready')])
+    assert samples(cache) == [('a', 'x', 'Failed'), ('a', 'y', 'Ready')]
+    # A deletion alone is a change too
+    assert cache.update([Record('a', 'y', '1', 'Ready')])
+    assert samples(cache) == [('a', 'y', 'Ready')]
+
+
+def test_unchanged_objects_keep_their_samples():
+    computed = []
+
+    def counting(rec):
+        computed.append(rec.name)
+        return [series(rec)]
+
+    cache = SeriesCache([info], counting)
+    cache.update([Record('a', 'x', '1', 'Ready'), Record('a', 'y', '1', 'Ready')])
+    cache.update([Record('a', 'x', '1', 'Ready'), Record('a', 'y', '2', 'Ready')])
+    assert computed == ['x', 'y', 'y']
+
+
+def test_empty_kind_still_feeds_rollups(fake_api):
+    # An application whose daily snapshot never appeared, with no
+    # ApplicationSnapshots in the cluster at all
+    api = fake_api({
+        'jobschedulers': [{'metadata': {'name': 'daily', 'namespace': 'a', 'resourceVersion': '1',
+                                        'creationTimestamp': '2020-01-01T00:00:00Z'},
+                           'spec': {'timeZoneName': 'UTC', 'daily': {'time': '00:00'}}}],
+        'protectionplans': [{'metadata': {'name': 'plan', 'namespace': 'a', 'resourceVersion': '1'},
+                             'spec': {'scheduleName': 'daily'}}],
+        'appprotectionplans': [{'metadata': {'name': 'app-plan', 'namespace': 'a', 'resourceVersion': '1'},
+                                'spec': {'applicationName': 'app', 'protectionPlanNames': ['plan']}}],
+    })
+    cluster = ndk_exporter.Cluster('', api, CollectorRegistry())
+    for kind in ndk_exporter.KINDS:
+        ndk_exporter.refresh(cluster, kind)
+    missing = [sample for family in cluster.schedules.collect() for sample in family.samples
+               if family.name == 'ndk_application_expected_snapshot_missing']
+    assert [(sample.labels['application'], sample.value) for sample in missing] == [('app', 1)]
+
+
+def test_objects_outside_kept_namespaces_are_never_projected():
+    fields = Fields('Object', {'namespace': 'metadata.namespace', 'name': 'metadata.name',
+                               'phase': ['status.phase', 'unknown']})
+    projected = []
+    project = fields.project
+    fields.project = lambda obj: projected.append(obj['metadata']['name']) or project(obj)
+    cache = SeriesCache([info], lambda rec: [series(rec)], keep=NamespaceFilter(deny=['kube-*']))
+    objects = [{'metadata': {'namespace': 'a', 'name': 'x', 'resourceVersion': '1'}},
+               {'metadata': {'namespace': 'kube-system', 'name': 'y', 'resourceVersion': '1'}}]
+    cache.update(objects, fields)
+    cache.update(objects, fields)
+    assert projected == ['x']
+    assert samples(cache) == [('a', 'x', 'unknown')]
+
+
+def test_capped_series_are_counted_per_cache():
+    capped = Metric('test_capped_info', 'Test objects', ['name'])
+    capped.max_series = 1
+    capped_series = capped.sampler({'name': lambda rec: rec.name}, lambda rec: 1)
+    registries = [CollectorRegistry(), CollectorRegistry()]
+    caches = [SeriesCache([capped], lambda rec: [capped_series(rec)], dropped=ClusterMetrics(registry).series_dropped)
+              for registry in registries]
+    caches[0].update([Record('a', name, '1', 'Ready') for name in 'xyz'])
+    caches[1].update([Record('a', 'x', '1', 'Ready')])
+    assert len(caches[0].families[0].samples) == 1
+    assert [registry.get_sample_value('ndk_exporter_series_dropped', {'metric': 'test_capped_info'})
+            for registry in registries] == [2, 0]
@@ -0,0 +1,73 @@
+import pytest
+
+import sharding
+from listing import ListPager
+from sharding import Shard, shard_from_env
+
+NAMESPACES = [f'ns-{i}' for i in range(1000)]
+
+
+def test_every_namespace_has_one_owner():
+    shards = [Shard(index, 4) for index in range(4)]
+    for namespace in NAMESPACES:
+        assert sum(shard.owns(namespace) for shard in shards) == 1
+    # Each shard gets roughly a quarter
+    assert all(150 < sum(map(shard.owns, NAMESPACES)) < 350 for shard in shards)
+
+
+def test_adding_a_shard_only_moves_namespaces_to_it():
+    before, after = Shard(0, 3), Shard(0, 4)
+    moved = [namespace for namespace in NAMESPACES if before.owner(namespace) != after.owner(namespace)]
+    assert all(after.owner(namespace) == 3 for namespace in moved)
+    assert 150 < len(moved) < 350
+
+
+def test_removing_a_shard_only_moves_its_namespaces():
+    before, after = Shard(0, 4), Shard(0, 3)
+    moved = [namespace for namespace in NAMESPACES if before.owner(namespace) != after.owner(namespace)]
+    assert all(before.owner(namespace) == 3 for namespace in moved)
+
+
+def test_shard_from_hostname_ordinal():
+    assert shard_from_env({'NDK_SHARDS': '1', 'HOSTNAME': 'ndk-exporter-0'}) is None
+    shard = shard_from_env({'NDK_SHARDS': '3', 'HOSTNAME': 'ndk-exporter-2'})
+    assert (shard.index, shard.count, shard.primary) == (2, 3, False)
+    assert shard_from_env({'NDK_SHARDS': '3', 'NDK_SHARD': '0', 'HOSTNAME': 'ndk-exporter-2'}).primary
+    with pytest.raises(ValueError):
+        shard_from_env({'NDK_SHARDS': '3', 'HOSTNAME': 'ndk-exporter-3'})
+    with pytest.raises(ValueError):
+        shard_from_env({'NDK_SHARDS': '3', 'HOSTNAME': 'ndk-exporter'})
+
+
+def test_namespaces_are_relisted_every_interval(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(sharding.time, 'monotonic', lambda: now[0])
+    shard = Shard(1, 2)
+    listed = []
+
+    def list_namespaces():
+        listed.append(now[0])
+        if len(listed) == 3:
+            raise RuntimeError('apiserver unavailable')
+        return NAMESPACES[:20]
+
+    owned = shard.namespaces(list_namespaces, keep=lambda namespace: namespace != 'ns-0')
+    assert owned == sorted(namespace for namespace in NAMESPACES[1:20] if shard.owns(namespace))
+    now[0] = sharding.NAMESPACE_INTERVAL - 1
+    assert shard.namespaces(list_namespaces) == owned
+    now[0] = sharding.NAMESPACE_INTERVAL
+    assert shard.namespaces(list_namespaces) is not None
+    # A failed relist keeps the last list
+    now[0] = 2 * sharding.NAMESPACE_INTERVAL
+    assert shard.namespaces(list_namespaces) is not None
+    assert len(listed) == 3
+
+
+def test_namespaced_pager_lists_one_namespace(fake_api):
+    objects = [{'metadata': {'namespace': namespace, 'name': 'a', 'resourceVersion': '1'}}
+               for namespace in ('ns-1', 'ns-2')]
+    api = fake_api({'applicationsnapshots': objects})
+    pager = ListPager(api, 'dataservices.nutanix.com', 'v1alpha1', 'applicationsnapshots', 500, 20,
+                      namespace='ns-2')
+    assert [item['metadata']['namespace'] for item in pager] == ['ns-2']
+    assert api.calls[0]['namespace'] == 'ns-2'
@@ -0,0 +1,119 @@
+import pickle
+import time
+import zlib
+
+from prometheus_client import CollectorRegistry
+
+import ndk_exporter
+import warmstart
+from informer import Informer
+
+OBJECTS = {
+    'applications': [
+        {'metadata': {'name': 'app', 'namespace': 'a', 'resourceVersion': '10', 'uid': 'u-app'},
+         'status': {'conditions': [{'type': 'Ready', 'status': 'True',
+                                    'lastTransitionTime': '2026-10-01T00:00:00Z'}]}},
+    ],
+    'applicationsnapshots': [
+        {'metadata': {'name': f'snap-{i}', 'namespace': 'a', 'resourceVersion': str(20 + i), 'uid': f'u-{i}',
+                      'creationTimestamp': '2026-10-01T00:00:00Z'},
+         'spec': {'source': {'applicationRef': {'name': 'app'}}},
+         'status': {'readyToUse': i != 2, 'creationTime': '2026-10-01T00:00:03Z',
+                    'expirationTime': '2026-10-31T00:00:03Z'}}
+        for i in range(3)
+    ],
+}
+
+
+def exported(cluster):
+    """Every NDK sample a cluster serves, as comparable tuples, leaving out ages that change by the second."""
+    return sorted((sample.name, tuple(sorted(sample.labels.items())), sample.value)
+                  for family in cluster.registry.collect() if family.name.startswith('ndk_')
+                  and not family.name.startswith('ndk_exporter_') and not family.name.endswith('_age_seconds')
+                  for sample in family.samples)
+
+
+def stale(cluster, plural):
+    return cluster.registry.get_sample_value('ndk_exporter_kind_stale', {'kind': plural})
+
+
+def save_and_load(path, clusters, monkeypatch):
+    monkeypatch.setattr(ndk_exporter, 'clusters', clusters)
+    warmstart.dump(path, dict(ndk_exporter.gather_state(), saved_at=time.time()))
+    return warmstart.load(path, 3600)
+
+
+def test_poll_mode_round_trip(fake_api, tmp_path, monkeypatch):
+    monkeypatch.setattr(ndk_exporter, 'MODE', 'poll')
+    before = ndk_exporter.Cluster('', fake_api(OBJECTS), CollectorRegistry())
+    for kind in ndk_exporter.KINDS:
+        ndk_exporter.refresh(before, kind)
+    state = save_and_load(tmp_path / 'state', [before], monkeypatch)
+
+    after = ndk_exporter.Cluster('', fake_api(), CollectorRegistry())
+    assert ndk_exporter.restore_cluster(after, state['clusters']['']) == len(ndk_exporter.KINDS)
+    assert exported(after) == exported(before)
+    assert any(name == 'ndk_application_snapshot_info' for name, _, _ in exported(after))
+    # Served, but stale until listed again, and poll mode has no watch to resume
+    assert stale(after, 'applicationsnapshots') == 1
+    assert after.restored == {}
+    assert after.transitions.state() == before.transitions.state()
+    assert after.snapshot_ready_latency.state() == before.snapshot_ready_latency.state()
+
+    # The first refresh finds nothing new in the restored cache
+    kind = next(kind for kind in ndk_exporter.KINDS if kind.plural == 'applicationsnapshots')
+    after.api = fake_api(OBJECTS)
+    assert not ndk_exporter.refresh(after, kind)
+    assert stale(after, 'applicationsnapshots') == 0
+
+
+def test_informer_mode_hands_the_store_to_the_informer(fake_api, tmp_path, monkeypatch):
+    monkeypatch.setattr(ndk_exporter, 'MODE', 'informer')
+    api = fake_api(OBJECTS)
+    before = ndk_exporter.Cluster('', api, CollectorRegistry())
+    kind = next(kind for kind in ndk_exporter.KINDS if kind.plural == 'applicationsnapshots')
+    informer = Informer(api, kind.group, kind.version, kind.plural, before.metrics, project=kind.fields.project)
+    informer.relist()
+    before.informers[kind.plural] = informer
+    state = save_and_load(tmp_path / 'state', [before], monkeypatch)
+    # Informers that never synced are not saved
+    assert list(state['clusters']['']['kinds']) == ['applicationsnapshots']
+
+    after = ndk_exporter.Cluster('', fake_api(), CollectorRegistry())
+    ndk_exporter.restore_cluster(after, state['clusters'][''])
+    resource_version, items = after.restored['applicationsnapshots']
+    assert resource_version == '1'
+    assert sorted(key for key, _ in items) == [('a', f'snap-{i}') for i in range(3)]
+    assert sorted(items) == sorted(informer.snapshot()[1])
+
+
+def test_kinds_whose_fields_changed_are_listed_instead(fake_api, tmp_path, monkeypatch):
+    monkeypatch.setattr(ndk_exporter, 'MODE', 'poll')
+    before = ndk_exporter.Cluster('', fake_api(OBJECTS), CollectorRegistry())
+    for kind in ndk_exporter.KINDS:
+        ndk_exporter.refresh(before, kind)
+    state = save_and_load(tmp_path / 'state', [before], monkeypatch)
+    saved = state['clusters']['']
+    fields, resource_version, items = saved['kinds']['applicationsnapshots']
+    saved['kinds']['applicationsnapshots'] = (fields[:-1], resource_version, items)
+
+    after = ndk_exporter.Cluster('', fake_api(), CollectorRegistry())
+    assert ndk_exporter.restore_cluster(after, saved) == len(ndk_exporter.KINDS) - 1
+    assert 'applicationsnapshots' not in after.loaded
+    assert not any(name == 'ndk_application_snapshot_info' for name, _, _ in exported(after))
+
+
+def test_old_states_are_ignored(tmp_path):
+    path = tmp_path / 'state'
+    warmstart.dump(path, {'clusters': {}, 'saved_at': time.time() - 7200})
+    assert warmstart.load(path, 3600) is None
+    assert warmstart.load(path, 10800) is not None
+    # States written by another version of the exporter
+    path.write_bytes(zlib.compress(pickle.dumps({'format': warmstart.FORMAT - 1, 'saved_at': time.time()})))
+    assert warmstart.load(path, 3600) is None
+
+
+def test_missing_or_corrupt_state_is_ignored(tmp_path):
+    assert warmstart.load(tmp_path / 'none', 3600) is None
+    (tmp_path / 'bad').write_bytes(b'not a state file')
+    assert warmstart.load(tmp_path / 'bad', 3600) is None